@@ -54,7 +54,10 @@ async def lifespan(app: FastAPI):
     # Since we are single process now, it's safer.
     app.state.rag_service = RagService() 
     
-    app.state.hybrid_retriever = HybridRetriever(collection=app.state.code_collection)
+    app.state.hybrid_retriever = HybridRetriever(
+        collection=app.state.code_collection,
+        bm25_cache_path=Path(__file__).parent / "repos" / "bm25_tokens.pkl"
+    )
 
     # 5. Initialize Ingestion
     app.state.code_ingestion = CodeIngestionService()
@@ -66,6 +69,7 @@ async def lifespan(app: FastAPI):
         print(f"⚠️ Failed to load code graphs: {e}")
 
     app.state.document_service = DocumentService(app.state.rag_service, app.state.db_service)
+    await app.state.document_service.warmup()
     
     print("✅ All Services Ready & Mounted to app.state")
     
@@ -76,6 +80,8 @@ async def lifespan(app: FastAPI):
     yield
     
     print("🛑 Shutting down...")
+    app.state.code_ingestion.shutdown()
+    app.state.document_service.shutdown()
 
 app = FastAPI(
     title="DevOps Copilot API",
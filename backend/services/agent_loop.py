@@ -3,12 +3,37 @@ Agent Loop for DevOps Copilot V3
 ReAct-style reasoning with tool execution.
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from pydantic import BaseModel
 import json
 import re
 from datetime import datetime
 
+# Fast JSON (optional)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _json_dumps(obj: Any) -> str:
+    """Serialize to a JSON string, preferring orjson when installed"""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            # orjson rejects non-str dict keys; stdlib coerces them
+            pass
+    return json.dumps(obj)
+
+
+def _json_loads(s):
+    """Parse JSON from str or bytes, preferring orjson when installed"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(s.encode() if isinstance(s, str) else s)
+    return json.loads(s)
+
 
 class AgentStep(BaseModel):
     """Single step in agent execution"""
@@ -37,19 +62,49 @@ class AgentLoop:
       4. Repeat or respond
     """
     
+    # Tool menu lines shown to the LLM
+    TOOL_DESCRIPTIONS = {
+        "search_code": 'Search the indexed repositories (code, READMEs, config files). Input: {"query": "search terms"}',
+        "search_docs": 'Search USER UPLOADED PDF documents (e.g. manuals, annual reports). Input: {"query": "search terms"}',
+        "jira_create": 'Create a JIRA ticket. Input: {"summary": "...", "description": "...", "priority": "High/Medium/Low"}',
+        "slack_post": 'Post a message to Slack. Input: {"channel": "#channel-name", "message": "..."}',
+        "k8s_exec": 'Execute a Kubernetes command. Input: {"command": "kubectl ..."}',
+        "calendar_event": 'Create a calendar event. Input: {"title": "...", "participants": [...], "time": "..."}',
+        "final_answer": 'Provide the final answer to the user. Input: {"answer": "your response"}',
+    }
+    
+    # IAM permission -> tools it unlocks in the menu.
+    # Tools not listed under any permission (slack_post, final_answer) are always shown.
+    PERMISSION_TOOLS = {
+        "READ_CODEBASE": ("search_code",),
+        "SEARCH_CODE": ("search_code",),
+        "READ_DOCS": ("search_docs",),
+        "WRITE_JIRA": ("jira_create",),
+        "RUN_HEALTHCHECKS": ("k8s_exec",),
+        "CHECK_SERVICES": ("k8s_exec",),
+        "READ_LOGS": ("k8s_exec",),
+        "SCHEDULE_MEETING": ("calendar_event",),
+    }
+    
+    # Rendered tool menus, keyed by the sorted tuple of permissions.
+    # Shared across instances since an AgentLoop is created per request.
+    _tool_desc_by_permissions: Dict[Tuple[str, ...], str] = {}
+    
     def __init__(
         self,
         llm_service,
         hybrid_retriever,
         code_ingestion=None,
         rag_service=None,
-        max_steps: int = 5
+        max_steps: int = 5,
+        history_window: int = 10
     ):
         self.llm = llm_service
         self.retriever = hybrid_retriever
         self.code_ingestion = code_ingestion
         self.rag_service = rag_service
         self.max_steps = max_steps
+        self.history_window = history_window  # Most recent messages kept in the prompt
         
         # Tool registry
         self.tools = {
@@ -62,16 +117,31 @@ class AgentLoop:
             "final_answer": self._final_answer,
         }
         
-        self.tool_descriptions = """
-available Tools:
-- search_code: Search the indexed repositories (code, READMEs, config files). Input: {"query": "search terms"}
-- search_docs: Search USER UPLOADED PDF documents (e.g. manuals, annual reports). Input: {"query": "search terms"}
-- jira_create: Create a JIRA ticket. Input: {"summary": "...", "description": "...", "priority": "High/Medium/Low"}
-- slack_post: Post a message to Slack. Input: {"channel": "#channel-name", "message": "..."}
-- k8s_exec: Execute a Kubernetes command. Input: {"command": "kubectl ..."}
-- calendar_event: Create a calendar event. Input: {"title": "...", "participants": [...], "time": "..."}
-- final_answer: Provide the final answer to the user. Input: {"answer": "your response"}
-"""
+        self.tool_descriptions = self._render_tool_menu(tuple(self.tools))
+    
+    def _render_tool_menu(self, tool_names: Tuple[str, ...]) -> str:
+        """Render the tool menu block for the given tool names"""
+        lines = "".join(
+            f"- {name}: {self.TOOL_DESCRIPTIONS[name]}\n"
+            for name in tool_names if name in self.TOOL_DESCRIPTIONS
+        )
+        return f"\navailable Tools:\n{lines}"
+    
+    def _tool_descriptions_for(self, capabilities) -> str:
+        """Tool menu restricted to the tools the permissions unlock (memoized per permission set)"""
+        if capabilities is None:
+            return self.tool_descriptions
+        
+        key = tuple(sorted(capabilities.permissions))
+        menu = self._tool_desc_by_permissions.get(key)
+        if menu is None:
+            gated = {tool for tools in self.PERMISSION_TOOLS.values() for tool in tools}
+            allowed = {tool for perm in key for tool in self.PERMISSION_TOOLS.get(perm, ())}
+            menu = self._render_tool_menu(
+                tuple(name for name in self.tools if name in allowed or name not in gated)
+            )
+            self._tool_desc_by_permissions[key] = menu
+        return menu
 
     async def run(
         self,
@@ -120,15 +190,8 @@ available Tools:
         # Handle None capabilities gracefully
         permissions_str = ', '.join(capabilities.permissions) if capabilities else 'READ_DOCS'
         
-        # Format history
-        history_str = ""
-        if conversation_history:
-            for msg in conversation_history:
-                # Handle both Dict and Object (Pydantic) types safely
-                r = msg.get("role", "") if isinstance(msg, dict) else getattr(msg, "role", "")
-                c = msg.get("content", "") if isinstance(msg, dict) else getattr(msg, "content", "")
-                if r and c:
-                    history_str += f"{r.upper()}: {c}\n"
+        # Format history (bounded tail, built once per run)
+        history_str = self._format_history(conversation_history)
 
         context = f"""User Query: {query}
 Role: {role}
@@ -137,28 +200,22 @@ Permissions: {permissions_str}
 Conversation History:
 {history_str}
 
-{self.tool_descriptions}
+{self._tool_descriptions_for(capabilities)}
 
 You are an agent designed to answer questions by thinking step-by-step and using tools.
-You MUST output your response in this exact format:
+You MUST output a single JSON object in this exact shape:
 
-Thought: [Your reasoning about what to do next]
-Action: [The name of the tool to use, or "final_answer"]
-Action Input: [The JSON argument for the tool]
+{{"thought": "<your reasoning about what to do next>", "action": "<tool name or final_answer>", "input": {{<the JSON argument for the tool>}}}}
 
 Example 1 (Need to search code):
-Thought: The user is asking about the auth flow. I should search for "authentication" in the code.
-Action: search_code
-Action Input: {{"query": "authentication flow"}}
+{{"thought": "The user is asking about the auth flow. I should search for authentication in the code.", "action": "search_code", "input": {{"query": "authentication flow"}}}}
 
 Example 2 (Answering directly):
-Thought: The user said hello. I don't need to use any tools.
-Action: final_answer
-Action Input: {{"answer": "Hello! How can I help you today?"}}
+{{"thought": "The user said hello. I don't need to use any tools.", "action": "final_answer", "input": {{"answer": "Hello! How can I help you today?"}}}}
 
 CRITICAL:
-1. ALWAYS start with "Thought:".
-2. ALWAYS include "Action:" and "Action Input:".
+1. ALWAYS output valid JSON with "thought", "action" and "input".
+2. "action" MUST be one of the available tools.
 3. If you have the answer, use "final_answer".
 """
         
@@ -194,10 +251,12 @@ CRITICAL:
                 
                 # Truncate observation - use larger limit for document context
                 max_obs_len = 6000  # Increased from 1000 for better document context
-                if len(str(observation)) > max_obs_len:
-                    observation_truncated = str(observation)[:max_obs_len] + f"... (truncated, {len(str(observation))} total chars)"
+                obs_str = observation if isinstance(observation, str) else str(observation)
+                obs_len = len(obs_str)
+                if obs_len > max_obs_len:
+                    observation_truncated = obs_str[:max_obs_len] + f"... (truncated, {obs_len} total chars)"
                 else:
-                    observation_truncated = str(observation)
+                    observation_truncated = obs_str
                 
                 # Yield action result
                 if action in ["jira_create", "slack_post", "k8s_exec", "calendar_event"]:
@@ -212,29 +271,71 @@ CRITICAL:
                 yield {"type": "step", "text": f"Executing {action}...", "state": "done"}
                 
                 # Update context
-                context += f"\n\nStep {step_num}:\nThought: {thought}\nAction: {action}\nAction Input: {json.dumps(action_input)}\nObservation: {observation_truncated}\n"
+                context += f"\n\nStep {step_num}:\nThought: {thought}\nAction: {action}\nAction Input: {_json_dumps(action_input)}\nObservation: {observation_truncated}\n"
             else:
                 context += f"\n\nStep {step_num}:\nThought: {thought}\nAction: {action}\nObservation: Unknown tool '{action}'. Available tools: {list(self.tools.keys())}\n"
         
         # Max steps reached\n        yield {"type": "answer", "content": "I've reached my reasoning limit. Please try rephrasing your question."}
     
+    def _format_history(self, conversation_history: List[Dict[str, Any]] = None) -> str:
+        """Render the most recent `history_window` messages as 'ROLE: content' lines"""
+        # history_window=0 means no history ([-0:] would be the whole list)
+        if not conversation_history or self.history_window <= 0:
+            return ""
+        
+        lines = []
+        for msg in conversation_history[-self.history_window:]:
+            # Handle both Dict and Object (Pydantic) types safely
+            r = msg.get("role", "") if isinstance(msg, dict) else getattr(msg, "role", "")
+            c = msg.get("content", "") if isinstance(msg, dict) else getattr(msg, "content", "")
+            if r and c:
+                lines.append(f"{r.upper()}: {c}\n")
+        return "".join(lines)
+    
     async def _think(self, context: str, history: List[Dict[str, Any]] = None) -> str:
         """Get LLM to think about next step"""
         prompt = f"""{context}
 
-Now, think step by step about what to do next. Remember to use 'Thought:', 'Action:', and 'Action Input:'."""
+Now, think step by step about what to do next. Respond with the JSON object only."""
+        
+        system = (
+            "You are an AI agent that reasons step-by-step to answer user queries. "
+            'Respond ONLY with a JSON object of the form {"thought": string, "action": string, "input": object}. '
+            f"\"action\" must be one of: {' | '.join(self.tools)}."
+        )
         
         try:
             response = await self.llm._call_ollama(
                 prompt,
-                system="You are an AI agent that reasons step-by-step to answer user queries. Follow the ReAct format: Thought, Action, Action Input."
+                system=system,
+                format="json",
+                options={"temperature": 0.1}
             )
             return response
         except Exception as e:
             return f"Thought: I encountered an error. Let me provide a direct answer.\nAction: final_answer\nAction Input: {{\"answer\": \"I apologize, but I encountered an issue processing your request.\"}}"
     
     def _parse_response(self, response: str) -> tuple:
-        """Parse LLM response into thought, action, action_input"""
+        """Parse LLM JSON response into thought, action, action_input"""
+        try:
+            obj = _json_loads(response)
+        except (ValueError, TypeError):
+            obj = None
+        
+        if isinstance(obj, dict) and obj.get("action"):
+            action = str(obj["action"]).strip()
+            action_input = obj.get("input") or {}
+            if not isinstance(action_input, dict):
+                # Tolerate bare values, e.g. {"action": "final_answer", "input": "Hi"}
+                key = "answer" if action == "final_answer" else "raw"
+                action_input = {key: action_input}
+            return str(obj.get("thought", "")).strip(), action, action_input
+        
+        # Single-shot fallback for free-form ReAct text
+        return self._parse_react_text(response)
+    
+    def _parse_react_text(self, response: str) -> tuple:
+        """Parse free-form 'Thought/Action/Action Input' text into thought, action, action_input"""
         thought = ""
         action = "final_answer"
         action_input = {}
@@ -261,7 +362,7 @@ Now, think step by step about what to do next. Remember to use 'Thought:', 'Acti
         input_match = re.search(r'Action Input:\s*(?:```(?:json)?\s*)?({.+?})(?:\s*```)?', response, re.DOTALL | re.IGNORECASE)
         if input_match:
             try:
-                action_input = json.loads(input_match.group(1))
+                action_input = _json_loads(input_match.group(1))
             except json.JSONDecodeError:
                 try:
                     import ast
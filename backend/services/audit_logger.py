@@ -37,11 +37,16 @@ class AuditLogger:
     """
     Audit logging system with:
     - Immutable logs persisted to SQLite
-    - Real-time streaming via in-memory queues
+    - Real-time streaming via a shared broadcast ring buffer
+      (each subscriber keeps its own read index)
     """
     
+    RING_SIZE = 4096
+    
     def __init__(self, max_logs: int = 1000):
-        self.subscribers: List[asyncio.Queue] = []
+        self._ring: List[Optional[LogEntry]] = [None] * self.RING_SIZE
+        self._head = 0  # Total entries ever written
+        self._cond = asyncio.Condition()
         self._log_counter = 0
         self.db = DatabaseService()
         
@@ -75,12 +80,11 @@ class AuditLogger:
         log_data["action_type"] = log_data.pop("action") # Remap for DB schema
         await self.db.log_event(log_data)
         
-        # 2. Notify subscribers (Real-time stream)
-        for queue in self.subscribers:
-            try:
-                queue.put_nowait(entry)
-            except asyncio.QueueFull:
-                pass
+        # 2. Publish to ring buffer and wake subscribers (Real-time stream)
+        self._ring[self._head % self.RING_SIZE] = entry
+        self._head += 1
+        async with self._cond:
+            self._cond.notify_all()
         
         # Console output
         status_emoji = "✅" if status == "ALLOWED" else "🚫" if status == "DENIED" else "❌"
@@ -101,15 +105,19 @@ class AuditLogger:
     
     async def stream(self) -> AsyncIterator[LogEntry]:
         """Stream logs in real-time via async generator"""
-        queue = asyncio.Queue(maxsize=100)
-        self.subscribers.append(queue)
+        idx = self._head
         
-        try:
-            while True:
-                log = await queue.get()
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: self._head > idx)
+            
+            while idx < self._head:
+                # Lagged more than a full ring: skip entries already overwritten
+                if self._head - idx > self.RING_SIZE:
+                    idx = self._head - self.RING_SIZE
+                log = self._ring[idx % self.RING_SIZE]
+                idx += 1
                 yield log
-        finally:
-            self.subscribers.remove(queue)
     
     # get_by_trace_id and get_denied_logs would also need DB impl, 
     # but for now I'll just remove them or impl them if needed.
@@ -18,7 +18,10 @@ async def run_agent_background(
 ):
     """
     Background task to run the agent and persist results.
+    The final answer is accumulated from the stream itself, so the agent runs once.
     """
+    answer_parts: List[str] = []
+    actions: List[Dict[str, Any]] = []
     try:
         # Stream events
         async for event in agent.run_stream(
@@ -30,11 +33,10 @@ async def run_agent_background(
             # Put event in queue for live stream
             await event_queue.put(event)
             
-            # Persist relevant events to DB?
-            # Ideally we'd append to the message as we go, or update it.
-            # But the current DB schema might only support simple content.
-            # For now, we will collect the full answer and save it at the end.
-            # OR we can save the steps as a JSON blob if the schema allows.
+            if event["type"] == "answer":
+                answer_parts.append(event.get("content", ""))
+            elif event["type"] == "action_result":
+                actions.append(event["data"])
             
     except Exception as e:
         logger.error(f"Error in background agent: {e}")
@@ -44,11 +46,13 @@ async def run_agent_background(
         await event_queue.put(None) # Sentinel
         
         # Save the FINAL assistant message to DB
-        # We need to extract the answer from the events... 
-        # But this function is streaming.
-        # We should probably run `agent.run` (non-streaming) to get the result object?
-        # NO, we used `run_stream`. To get the final answer, we must track it.
-        pass
-
-# This is a bit tricky. We need to duplicate the logic of collecting the answer if we want to save it.
-# Let's improve this helper.
+        if answer_parts:
+            try:
+                await db_service.add_message(
+                    conversation_id,
+                    "assistant",
+                    "".join(answer_parts),
+                    metadata={"actions": actions} if actions else None
+                )
+            except Exception as e:
+                logger.error(f"Failed to persist assistant message: {e}")
@@ -4,17 +4,32 @@ Handles GitHub repo cloning, AST parsing using Tree-sitter, and code embedding.
 """
 
 import os
+import sys
 import uuid
 import shutil
 import asyncio
+import threading
+import mmap
+import warnings
+from collections import deque
+from contextlib import contextmanager
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from datetime import datetime
-import re
 import json
+import hashlib
+import pickle
+import sqlite3
+import zlib
+import zipfile
+import tempfile
+from urllib.parse import urlparse
 
-# Git operations
-from git import Repo
+# GitHub archive downloads
+import httpx
 
 # Graph for code relationships
 import networkx as nx
@@ -27,6 +42,81 @@ except ImportError:
     TREE_SITTER_AVAILABLE = False
     print("⚠️ tree-sitter not installed.")
 
+# Fast JSON (optional)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Compact binary chunk persistence (optional, falls back to chunks.json)
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Bump when chunking output changes so stale parse-cache entries are ignored
+PARSE_CACHE_VERSION = "3"
+
+
+class ParseCache:
+    """
+    Content-addressed parse cache shared by all ingestions.
+    Maps (sha256(content), lang, grammar_ver) -> repo-independent chunk rows
+    (text, chunk_type, name, start_line, end_line), stored as compressed pickle.
+    """
+    
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        # One connection shared by every thread that parses (e.g. the to_thread fallback); the lock serializes it
+        self._lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+            # WAL: pool workers read/write the cache concurrently
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    hash TEXT NOT NULL,
+                    lang TEXT NOT NULL,
+                    grammar_ver TEXT NOT NULL,
+                    chunks BLOB NOT NULL,
+                    PRIMARY KEY (hash, lang, grammar_ver)
+                )
+            """)
+            self._conn = conn
+        return self._conn
+    
+    def get(self, digest: str, lang: str, grammar_ver: str) -> Optional[List[tuple]]:
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT chunks FROM cache WHERE hash = ? AND lang = ? AND grammar_ver = ?",
+                    (digest, lang, grammar_ver)
+                ).fetchone()
+            return pickle.loads(zlib.decompress(row[0])) if row else None
+        except Exception as e:
+            print(f"⚠️ Parse cache read failed: {e}")
+            return None
+    
+    def put(self, digest: str, lang: str, grammar_ver: str, rows: List[tuple]) -> None:
+        try:
+            blob = zlib.compress(pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL))
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (hash, lang, grammar_ver, chunks) VALUES (?, ?, ?, ?)",
+                    (digest, lang, grammar_ver, blob)
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"⚠️ Parse cache write failed: {e}")
+
+
 class CodeIngestionService:
     """
     Service for ingesting GitHub repos using Tree-sitter for robust parsing.
@@ -49,11 +139,46 @@ class CodeIngestionService:
         '.yaml': 'yaml',
     }
     
-    SKIP_DIRS = {
+    # Queries for extracting definitions (compiled once per language in _setup_parsers)
+    _QUERY_STRINGS = {
+        'python': """
+            (function_definition name: (identifier) @name body: (block) @body) @function
+            (class_definition name: (identifier) @name body: (block) @body) @class
+        """,
+        'javascript': """
+            (function_declaration name: (identifier) @name body: (statement_block) @body) @function
+            (class_declaration name: (identifier) @name body: (class_body) @body) @class
+        """,
+         'typescript': """
+            (function_declaration name: (identifier) @name body: (statement_block) @body) @function
+            (class_declaration name: (identifier) @name body: (class_body) @body) @class
+        """,
+        'go': """
+            (function_declaration name: (identifier) @name body: (block) @body) @function
+            (method_declaration name: (field_identifier) @name body: (block) @body) @method
+        """,
+         'java': """
+            (method_declaration name: (identifier) @name body: (block) @body) @method
+            (class_declaration name: (identifier) @name body: (class_body) @body) @class
+        """
+    }
+
+    PARSE_BATCH_SIZE = 32  # files per process-pool task
+    EMBED_BATCH_SIZE = 64  # chunks handed to rag_service per add_code_chunks call
+    EMBED_CONCURRENCY = 8  # embedding batches in flight at once
+    MMAP_THRESHOLD = 256 * 1024  # bytes
+    MAX_PARSE_SIZE = 1024 * 1024  # larger files are line-chunked, never tree-sitter parsed
+    PARSE_TIMEOUT_MICROS = 100_000  # per-file tree-sitter budget; slower files are line-chunked
+    SNIFF_BYTES = 8192  # head inspected for binary / minified content
+    MINIFIED_LINE_LENGTH = 5000
+    MINIFIED_SKIP_SIZE = 512 * 1024  # larger files that look minified are not indexed at all
+    MINIFIED_AVG_LINE_LENGTH = 400
+    
+    SKIP_DIRS = frozenset({
         'node_modules', '.git', '__pycache__', '.venv', 'venv', 
         'dist', 'build', '.next', '.nuxt', 'coverage', '.pytest_cache',
         'vendor', 'target', '.idea', '.vscode'
-    }
+    })
     
     def __init__(self, repos_dir: Optional[str] = None):
         if repos_dir is None:
@@ -65,15 +190,31 @@ class CodeIngestionService:
         # self.graph = nx.DiGraph()  <-- REMOVED: Caused race condition
         
         self.parsers = {}
+        self.queries = {}
+        self._grammar_version = "none"
         if TREE_SITTER_AVAILABLE:
             self._setup_parsers()
         
+        self._parse_cache = ParseCache(self.repos_dir / ".parse-cache.sqlite")
+        
+        # Code graphs per repo_id as (node_attrs, adjacency), built from chunks on first use
+        self._graphs: Dict[str, tuple] = {}
+        
+        # Long-lived process pool for CPU-bound parsing (created on first ingest)
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        
     def _setup_parsers(self):
         """Load compiled tree-sitter languages."""
         lib_path = Path(__file__).parent.parent / "build" / "my-languages.so"
         if not lib_path.exists():
             print(f"⚠️ Tree-sitter library not found at: {lib_path}")
             return
+        
+        # Grammar identity for the parse cache: rebuilt library => new version
+        lib_stat = lib_path.stat()
+        self._grammar_version = hashlib.sha256(
+            f"{lib_stat.st_mtime_ns}:{lib_stat.st_size}".encode()
+        ).hexdigest()[:16]
 
         try:
             import ctypes
@@ -119,6 +260,8 @@ class CodeIngestionService:
                     parser.set_language(lang_obj)
                     self.parsers[lang_name] = parser
             
+            self._set_parse_timeouts()
+            self._compile_queries()
             print(f"✅ Tree-sitter parsers loaded: {list(self.parsers.keys())}")
         except Exception as e:
             print(f"⚠️ Error loading parsers: {e}")
@@ -135,9 +278,32 @@ class CodeIngestionService:
                     parser = Parser()
                     parser.set_language(lang_obj)
                     self.parsers[lang_name] = parser
+                 self._set_parse_timeouts()
+                 self._compile_queries()
             except:
                 pass
 
+    def _set_parse_timeouts(self):
+        """Cap parse time so one pathological file cannot stall a pool worker."""
+        for parser in self.parsers.values():
+            if hasattr(parser, 'set_timeout_micros'):
+                parser.set_timeout_micros(self.PARSE_TIMEOUT_MICROS)
+            else:
+                # 0.22+ exposes it as a (deprecated) property; still enforced by parse()
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', DeprecationWarning)
+                    parser.timeout_micros = self.PARSE_TIMEOUT_MICROS
+
+    def _compile_queries(self):
+        """Compile definition queries once; they are reused for every file."""
+        for lang_name, query_str in self._QUERY_STRINGS.items():
+            if lang_name not in self.LANGUAGES:
+                continue
+            try:
+                self.queries[lang_name] = self.LANGUAGES[lang_name].query(query_str)
+            except Exception as e:
+                print(f"Failed to compile query for {lang_name}: {e}")
+
     async def ingest_github_repo(
         self, 
         github_url: str, 
@@ -148,6 +314,7 @@ class CodeIngestionService:
     ) -> Dict[str, Any]:
         """Clone and parse repo using Tree-sitter."""
         try:
+            ingested_at = datetime.now().isoformat()
             repo_name = self._extract_repo_name(github_url)
             if not repo_id:
                 repo_id = str(uuid.uuid4())[:8]
@@ -166,49 +333,58 @@ class CodeIngestionService:
                 await db_service.update_repository_status(repo_id, "parsing")
             
             print(f"🔍 Parsing code files...")
-            code_chunks = await self._parse_repository(repo_path, repo_name, user_id)
+            # Chunks stream file by file to disk and into the vector DB, so only
+            # one embedding batch is held in memory. The code graph is built lazily
+            # on first query (see _repo_graph).
+            stats = {"file_count": 0, "chunk_count": 0, "graph_nodes": 0, "skipped_files": 0}
+            pending = []
+            embed_tasks = []
+            embed_slots = asyncio.Semaphore(self.EMBED_CONCURRENCY)
             
-            print(f"🔗 Building code graph...")
-            # Create a local graph for this ingestion process
-            repo_graph = nx.DiGraph()
-            await self._build_code_graph(code_chunks, repo_graph)
+            async def embed(batch):
+                try:
+                    await rag_service.add_code_chunks(batch)
+                finally:
+                    embed_slots.release()
             
-            stats = {
-                "file_count": len(set(c["metadata"]["file_path"] for c in code_chunks)),
-                "chunk_count": len(code_chunks),
-                "graph_nodes": repo_graph.number_of_nodes(),
-            }
+            async def dispatch_embedding(batch):
+                # Waiting for a free slot throttles parsing when embedding falls behind
+                await embed_slots.acquire()
+                embed_tasks.append(asyncio.create_task(embed(batch)))
+            
+            try:
+                header = {"type": "code", "repo_name": repo_name, "user_id": user_id, "ingested_at": ingested_at}
+                with self._repo_chunks_writer(repo_id, header) as write_chunks:
+                    async for file_chunks in self._parse_repository(repo_path, repo_name, user_id, ingested_at=ingested_at, stats=stats):
+                        stats["file_count"] += 1
+                        stats["chunk_count"] += len(file_chunks)
+                        stats["graph_nodes"] += self._graph_node_count(file_chunks)
+                        write_chunks(file_chunks)
+                        
+                        # EMBED CHUNKS to Vector DB (code_chunks collection), batches in flight concurrently
+                        if rag_service:
+                            pending.extend(file_chunks)
+                            full = len(pending) - len(pending) % self.EMBED_BATCH_SIZE
+                            for i in range(0, full, self.EMBED_BATCH_SIZE):
+                                await dispatch_embedding(pending[i:i + self.EMBED_BATCH_SIZE])
+                            pending = pending[full:]
+                
+                if rag_service and pending:
+                    await dispatch_embedding(pending)
+                await asyncio.gather(*embed_tasks)
+            except BaseException:
+                for task in embed_tasks:
+                    task.cancel()
+                raise
+            print(f"🧠 Stored {stats['chunk_count']} code chunks from {stats['file_count']} files")
             
             # Update DB: Ready
             if db_service:
                 await db_service.update_repository_status(repo_id, "ready", stats=stats)
-            
-            # Save Graph and Chunks to Disk (for persistence)
-            await self._save_repo_data(repo_id, code_chunks, repo_graph)
-
-            # 4. EMBED CHUNKS to Vector DB (CRITICAL FIX)
-            if rag_service:
-                print(f"🧠 Embedding {len(code_chunks)} code chunks...")
-                # We need to adapt chunks to what rag_service expects or use a dedicated method
-                # rag_service.add_documents expects {text, metadata, id}
-                # Our chunks have this structure.
-                # However, RAGService writes to 'document_chunks'. We might want 'code_chunks'.
-                # Let's check rag_service support for collections or just put them there for now.
-                # Ideally we want a separate collection.
-                # We will add a method to RagService to switch collection or add generic add_items.
-                # For now, let's assume we can pass collection_name or it handles it.
-                # Let's use rag_service.add_code_chunks if we add it, or just add_documents for now.
-                # Wait, rag_service defaults to "document_chunks". 
-                # We should update RagService to support code_chunks collection.
-                pass 
-                # I will handle the RagService update in the next step.
-                # But here I need to call it.
-                await rag_service.add_code_chunks(code_chunks)
 
             return {
                 "repo_id": repo_id,
                 "repo_name": repo_name,
-                "chunks": code_chunks,
                 "status": "ready",
                 **stats
             }
@@ -228,112 +404,299 @@ class CodeIngestionService:
     async def _clone_repo(self, github_url: str, repo_path: Path) -> None:
         if repo_path.exists():
             shutil.rmtree(repo_path)
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, lambda: Repo.clone_from(github_url, repo_path, depth=1))
+        
+        # GitHub: a single archive download, no git process or .git metadata.
+        # Private repos (404 without auth) and other hosts go through git.
+        owner_repo = self._github_owner_repo(github_url)
+        if owner_repo:
+            try:
+                await self._download_zip(*owner_repo, repo_path)
+                return
+            except Exception as e:
+                print(f"⚠️ GitHub archive download failed ({e}), falling back to git clone")
+                shutil.rmtree(repo_path, ignore_errors=True)
+        
+        # Shallow, blobless, single-branch clone straight from git; no thread-pool hop
+        proc = await asyncio.create_subprocess_exec(
+            'git', 'clone', '--depth=1', '--single-branch', '--filter=blob:none', '--no-tags',
+            github_url, str(repo_path),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"git clone failed: {stderr.decode(errors='replace').strip()}")
 
-    async def _parse_repository(self, repo_path: Path, repo_name: str, user_id: str) -> List[Dict[str, Any]]:
-        chunks = []
-        for file_path in repo_path.rglob('*'):
-            if file_path.is_dir() or any(skip in file_path.parts for skip in self.SKIP_DIRS):
-                continue
-            
-            ext = file_path.suffix.lower()
-            if ext not in self.SUPPORTED_EXTENSIONS:
-                continue
-                
+    def _github_owner_repo(self, github_url: str) -> Optional[Tuple[str, str]]:
+        parsed = urlparse(github_url)
+        if parsed.netloc.lower() not in ("github.com", "www.github.com"):
+            return None
+        parts = [p for p in parsed.path.split('/') if p]
+        if len(parts) < 2:
+            return None
+        repo = parts[1][:-4] if parts[1].endswith('.git') else parts[1]
+        return parts[0], repo
+
+    async def _download_zip(self, owner: str, repo: str, repo_path: Path) -> None:
+        """Stream the default branch's zipball to a temp file, then extract it off the event loop."""
+        archive_url = f"https://api.github.com/repos/{owner}/{repo}/zipball/HEAD"
+        with tempfile.TemporaryFile() as archive:
+            async with httpx.AsyncClient(timeout=120.0, follow_redirects=True) as client:
+                async with client.stream("GET", archive_url) as response:
+                    response.raise_for_status()
+                    async for block in response.aiter_bytes(1 << 20):
+                        archive.write(block)
+            archive.seek(0)
+            await asyncio.to_thread(_extract_zipball, archive, repo_path)
+
+    def _get_parse_pool(self) -> ProcessPoolExecutor:
+        if self._parse_pool is None:
+            # spawn: workers must not inherit threads/locks from the server process
+            self._parse_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._parse_pool
+
+    def shutdown(self) -> None:
+        """Stop the parse worker pool"""
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=False, cancel_futures=True)
+            self._parse_pool = None
+
+    def _iter_source_files(self, root: Path):
+        """
+        Walk the repo with os.scandir, pruning SKIP_DIRS before descending into them.
+        Yields plain path strings; they go to the parse pool as-is.
+        """
+        pending = deque([str(root)])
+        while pending:
+            directory = pending.popleft()
             try:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                
-                lang = self.SUPPORTED_EXTENSIONS[ext]
-                relative_path = str(file_path.relative_to(repo_path))
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in self.SKIP_DIRS:
+                                pending.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in self.SUPPORTED_EXTENSIONS:
+                            yield entry.path
+            except OSError as e:
+                print(f"⚠️ Skipping unreadable directory {directory}: {e}")
+
+    async def _parse_repository(
+        self,
+        repo_path: Path,
+        repo_name: str,
+        user_id: str,
+        ingested_at: Optional[str] = None,
+        stats: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Parse every source file, yielding each file's chunks as soon as it is done.
+        Skipped-file counts go into `stats` if given.
+        """
+        files = list(self._iter_source_files(repo_path))
+        ingested_at = ingested_at or datetime.now().isoformat()
+        remaining = set(files)
+        
+        # Tree-sitter parsing is CPU-bound: fan files out across worker processes,
+        # in batches to amortize IPC, but small enough to keep every worker busy
+        workers = os.cpu_count() or 1
+        batch_size = max(1, min(self.PARSE_BATCH_SIZE, len(files) // (workers * 4)))
+        batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+        
+        tasks = []
+        try:
+            pool = self._get_parse_pool()
+            tasks = [
+                asyncio.ensure_future(self._parse_in_pool(pool, batch, repo_path, repo_name, user_id))
+                for batch in batches
+            ]
+            for next_done in asyncio.as_completed(tasks):
+                for file_path, result in await next_done:
+                    remaining.discard(file_path)
+                    file_chunks = self._finish_file_chunks(result, ingested_at, stats)
+                    if file_chunks:
+                        yield file_chunks
+        except BrokenProcessPool as e:
+            print(f"⚠️ Parse pool failed ({e}), parsing in-process")
+            self._parse_pool = None
+            for f in files:
+                if f in remaining:
+                    # Read + parse off the event loop so other requests keep being served
+                    result = await asyncio.to_thread(self._parse_file, Path(f), repo_path, repo_name, user_id)
+                    file_chunks = self._finish_file_chunks(result, ingested_at, stats)
+                    if file_chunks:
+                        yield file_chunks
+        finally:
+            # Consumer stopped early or errored: don't leave parses queued
+            for task in tasks:
+                task.cancel()
+
+    async def _parse_in_pool(self, pool: ProcessPoolExecutor, batch: List[str], repo_path: Path, repo_name: str, user_id: str):
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            pool, _parse_files_worker, str(self.repos_dir), batch, str(repo_path), repo_name, user_id
+        )
+        return zip(batch, results)
+
+    def _finish_file_chunks(
+        self,
+        result: Optional[List[Dict[str, Any]]],
+        ingested_at: str,
+        stats: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Dedupe, intern and timestamp one file's parse result."""
+        if result is None:
+            if stats is not None:
+                stats["skipped_files"] = stats.get("skipped_files", 0) + 1
+            return []
+        
+        # Ids are content hashes (and embed the file path), so a repeated id is a
+        # verbatim duplicate definition within this file
+        unique = {c["id"]: c for c in result}
+        
+        # One timestamp per ingestion, stamped here rather than per chunk.
+        # Chunks unpickled from workers carry their own string copies; re-intern them.
+        for chunk in unique.values():
+            meta = chunk["metadata"]
+            for key in ("chunk_type", "file_path", "language", "repo_name", "user_id"):
+                meta[key] = sys.intern(meta[key])
+            meta["ingested_at"] = ingested_at
+        return list(unique.values())
+
+    def _parse_file(self, file_path: Path, repo_path: Path, repo_name: str, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Read and chunk a single source file, reusing cached parses of identical content.
+        Returns None for files skipped as unsupported, binary or large minified bundles.
+        """
+        lang = self.SUPPORTED_EXTENSIONS.get(file_path.suffix.lower())
+        if lang is None:
+            return None
+        
+        content_map = None
+        try:
+            with open(file_path, 'rb') as f:
+                # Sniff the head before reading the rest of the file
+                size = os.fstat(f.fileno()).st_size
+                head = f.read(self.SNIFF_BYTES)
+                if b'\x00' in head:
+                    return None
+                if size > self.MINIFIED_SKIP_SIZE and len(head) / (head.count(b'\n') + 1) > self.MINIFIED_AVG_LINE_LENGTH:
+                    return None
                 
-                if lang in self.parsers:
-                    try:
-                        file_chunks = self._parse_with_treesitter(content, relative_path, lang, repo_name, user_id)
-                    except Exception as e:
-                         print(f"Tree-sitter error {file_path}: {e}")
-                         file_chunks = self._chunk_by_lines(content, relative_path, lang, repo_name, user_id)
+                # Raw bytes go straight to tree-sitter; no decode/re-encode round trip.
+                # Large files are memory-mapped so the parser reads the page cache directly.
+                if size > self.MMAP_THRESHOLD:
+                    content_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    content_bytes = content_map
                 else:
-                    file_chunks = self._chunk_by_lines(content, relative_path, lang, repo_name, user_id)
-                
-                chunks.extend(file_chunks)
-            except Exception as e:
-                print(f"Error parsing {file_path}: {e}")
-                
-        return chunks
+                    f.seek(0)
+                    content_bytes = f.read()
+            
+            relative_path = str(file_path.relative_to(repo_path))
+            
+            # Oversized or minified files (bundles, generated code) get cheap line chunking
+            use_treesitter = (
+                lang in self.parsers
+                and size <= self.MAX_PARSE_SIZE
+                and max(len(line) for line in head.split(b'\n')) <= self.MINIFIED_LINE_LENGTH
+            )
+            
+            digest = hashlib.sha256(content_bytes).hexdigest()
+            grammar_ver = f"{PARSE_CACHE_VERSION}:{self._grammar_version if use_treesitter else 'lines'}"
+            rows = self._parse_cache.get(digest, lang, grammar_ver)
+            if rows is not None:
+                return self._chunks_from_rows(rows, relative_path, lang, repo_name, user_id)
+            
+            if use_treesitter:
+                try:
+                    chunks = self._parse_with_treesitter(content_bytes, relative_path, lang, repo_name, user_id)
+                except Exception as e:
+                     print(f"Tree-sitter error {file_path}: {e}")
+                     chunks = self._chunk_by_lines(_decode(content_bytes), relative_path, lang, repo_name, user_id)
+            else:
+                chunks = self._chunk_by_lines(_decode(content_bytes), relative_path, lang, repo_name, user_id)
+            
+            self._parse_cache.put(digest, lang, grammar_ver, self._rows_from_chunks(chunks, relative_path))
+            return chunks
+        except Exception as e:
+            print(f"Error parsing {file_path}: {e}")
+            return []
+        finally:
+            # Chunk text is sliced out (copied) before this point
+            if content_map is not None:
+                content_map.close()
 
-    def _parse_with_treesitter(self, content: str, file_path: str, lang: str, repo_name: str, user_id: str) -> List[Dict[str, Any]]:
+    def _rows_from_chunks(self, chunks: List[Dict[str, Any]], file_path: str) -> List[tuple]:
+        """Strip per-ingestion fields so rows can be reused for any repo/path."""
+        prefix = f"{file_path}:"
+        rows = []
+        for c in chunks:
+            meta = c["metadata"]
+            name = meta["name"]
+            # Line-chunk names embed the file path; store them path-relative
+            if meta["chunk_type"] == "code_block" and name.startswith(prefix):
+                name = name[len(prefix):]
+            rows.append((c["text"], meta["chunk_type"], name, meta["start_line"], meta["end_line"]))
+        return rows
+
+    def _chunks_from_rows(self, rows: List[tuple], file_path: str, lang: str, repo_name: str, user_id: str) -> List[Dict[str, Any]]:
+        return [
+            self._create_chunk(
+                text=text,
+                chunk_type=chunk_type,
+                name=f"{file_path}:{name}" if chunk_type == "code_block" else name,
+                file_path=file_path,
+                language=lang,
+                repo_name=repo_name,
+                user_id=user_id,
+                start_line=start_line,
+                end_line=end_line
+            )
+            for text, chunk_type, name, start_line, end_line in rows
+        ]
+
+    def _parse_with_treesitter(self, content_bytes: bytes, file_path: str, lang: str, repo_name: str, user_id: str) -> List[Dict[str, Any]]:
+        """Chunk raw file bytes by definition; only the matched slices are decoded."""
+        query = self.queries.get(lang)
+        if query is None:
+             return self._chunk_by_lines(_decode(content_bytes), file_path, lang, repo_name, user_id)
+        
         parser = self.parsers[lang]
-        tree = parser.parse(bytes(content, "utf8"))
+        
+        try:
+            tree = parser.parse(content_bytes)
+            if tree is None:
+                # Older bindings return None when the parse timeout expires
+                raise TimeoutError(f"parse exceeded {self.PARSE_TIMEOUT_MICROS}us")
+        except Exception:
+            # The parser is reused for every file this process handles; clear any
+            # half-finished parse state before the next one
+            parser.reset()
+            raise
         root_node = tree.root_node
         
-        # Queries for extracting definitions
-        queries = {
-            'python': """
-                (function_definition name: (identifier) @name body: (block) @body) @function
-                (class_definition name: (identifier) @name body: (block) @body) @class
-            """,
-            'javascript': """
-                (function_declaration name: (identifier) @name body: (statement_block) @body) @function
-                (class_declaration name: (identifier) @name body: (class_body) @body) @class
-            """,
-             'typescript': """
-                (function_declaration name: (identifier) @name body: (statement_block) @body) @function
-                (class_declaration name: (identifier) @name body: (class_body) @body) @class
-            """,
-            'go': """
-                (function_declaration name: (identifier) @name body: (block) @body) @function
-                (method_declaration name: (field_identifier) @name body: (block) @body) @method
-            """,
-             'java': """
-                (method_declaration name: (identifier) @name body: (block) @body) @method
-                (class_declaration name: (identifier) @name body: (class_body) @body) @class
-            """
-        }
         
-        query_str = queries.get(lang)
-        if not query_str:
-             return self._chunk_by_lines(content, file_path, lang, repo_name, user_id)
-            
         try:
-            language_obj = self.LANGUAGES[lang]
-            query = language_obj.query(query_str)
-            
-            # Correct API for tree-sitter 0.22+
-            cursor = QueryCursor()
-            captures = cursor.captures(query, root_node)
-            
+            # Grouped matches pair each definition node with its own @name node
             chunks = []
-            seen_ranges = set()
-            
-            for node, capture_name in captures:
-                if capture_name in ['function', 'class', 'method']:
-                    start_byte = node.start_byte
-                    end_byte = node.end_byte
-                    
-                    if start_byte in seen_ranges:
-                        continue
-                    seen_ranges.add(start_byte)
-                    
-                    text_bytes = content.encode('utf8')[start_byte:end_byte]
-                    text = text_bytes.decode('utf8', errors='replace')
-                    
-                    # Try to find name in text
-                    name = "block"
-                    lines = text.split('\n')
-                    first_line = lines[0].strip()
-                    
-                    # Generic robust matcher for definition lines
-                    name_match = re.search(r'(?:class|def|func|function|type|var|const|let)\s+([a-zA-Z0-9_]+)', first_line)
-                    if name_match:
-                        name = name_match.group(1)
+            # Released on exit so a memory-mapped source can be closed afterwards
+            with memoryview(content_bytes) as content_view:
+                for _, match in QueryCursor(query).matches(root_node):
+                    for capture_name in ('function', 'class', 'method'):
+                        node = _match_node(match, capture_name)
+                        if node is not None:
+                            break
                     else:
-                        # Check for method receivers in Go: func (r *Receiver) MethodName
-                        go_method = re.search(r'func\s+\(.*\)\s+([a-zA-Z0-9_]+)', first_line)
-                        if go_method:
-                            name = go_method.group(1)
-                            
+                        continue
+                
+                    name_node = _match_node(match, 'name')
+                    name = name_node.text.decode('utf8', errors='replace') if name_node is not None else "block"
+                
+                    # Zero-copy slice; str() decodes straight from the buffer
+                    text = str(content_view[node.start_byte:node.end_byte], 'utf8', errors='replace')
+                
                     chunks.append(self._create_chunk(
                         text=text,
                         chunk_type=capture_name,
@@ -347,13 +710,13 @@ class CodeIngestionService:
                     ))
             
             if not chunks:
-                 return self._chunk_by_lines(content, file_path, lang, repo_name, user_id)
+                 return self._chunk_by_lines(_decode(content_bytes), file_path, lang, repo_name, user_id)
 
             return chunks
 
         except Exception as e:
              print(f"⚠️ Tree-sitter error for {lang}: {e}. Falling back.")
-             return self._chunk_by_lines(content, file_path, lang, repo_name, user_id)
+             return self._chunk_by_lines(_decode(content_bytes), file_path, lang, repo_name, user_id)
 
     def _chunk_by_lines(self, content, file_path, language, repo_name, user_id, chunk_size=1000, overlap=100):
         """
@@ -387,116 +750,184 @@ class CodeIngestionService:
         return chunks
 
     def _recursive_split(self, text, separators, chunk_size, overlap):
-        """Recursive splitting helper"""
-        if len(text) <= chunk_size:
+        """
+        Single-pass splitting helper: each chunk is at most chunk_size characters and
+        ends just before the coarsest separator in the back half of its window
+        (class/def first, then blank lines, newlines, spaces); a window with no
+        separator there is hard-cut. Chunks are sliced straight out of the text,
+        so nothing is split or re-joined.
+        """
+        text_len = len(text)
+        if text_len <= chunk_size:
             return [text]
-            
-        # Find best separator
-        separator = separators[-1]
-        for sep in separators:
-            if sep in text:
-                separator = sep
-                break
         
-        # Split
-        parts = text.split(separator)
-        
-        # Merge parts back into chunks
         chunks = []
-        current_chunk = []
-        current_len = 0
-        
-        for part in parts:
-            part_len = len(part) + len(separator)
-            if current_len + part_len > chunk_size and current_chunk:
-                # Flush current chunk
-                chunks.append(separator.join(current_chunk))
-                # Handle overlap? (Simplified: no overlap for now to avoid duplications in RAG)
-                current_chunk = [part]
-                current_len = part_len
-            else:
-                current_chunk.append(part)
-                current_len += part_len
-        
-        if current_chunk:
-            chunks.append(separator.join(current_chunk))
-            
+        idx = 0
+        min_fill = max(1, chunk_size // 2)
+        while idx < text_len:
+            end = min(idx + chunk_size, text_len)
+            if end < text_len:
+                for sep in separators:
+                    cut = text.rfind(sep, idx + min_fill, end)
+                    if cut != -1:
+                        # The separator starts the next chunk, e.g. "\ndef name"
+                        end = cut
+                        break
+            # No overlap, to avoid duplications in RAG
+            chunks.append(text[idx:end])
+            idx = end
         return chunks
 
     def _create_chunk(self, text, chunk_type, name, file_path, language, repo_name, user_id, start_line, end_line):
+        # Content-derived id: identical code gets the same id on every ingestion
+        content_hash = hashlib.blake2b(text.encode('utf8'), digest_size=8).hexdigest()
         return {
-            "id": f"{repo_name}_{file_path}_{name}_{uuid.uuid4().hex[:8]}",
+            "id": f"{repo_name}_{file_path}_{name}_{content_hash}",
             "text": text,
             "metadata": {
                 "type": "code",
-                "chunk_type": chunk_type,
+                # Interned: these repeat across every chunk of a file/repo
+                "chunk_type": sys.intern(chunk_type),
                 "name": name,
-                "file_path": file_path,
-                "language": language,
-                "repo_name": repo_name,
-                "user_id": user_id,
+                "file_path": sys.intern(file_path),
+                "language": sys.intern(language),
+                "repo_name": sys.intern(repo_name),
+                "user_id": sys.intern(user_id),
                 "start_line": start_line,
                 "end_line": end_line,
-                "char_count": len(text),
-                "ingested_at": datetime.now().isoformat()
+                "char_count": len(text)
             }
         }
 
-    async def _build_code_graph(self, chunks, graph: nx.DiGraph):
-        graph.clear()
-        
-        # Add file nodes first
-        files = set(c["metadata"]["file_path"] for c in chunks)
-        for file_path in files:
-            file_node_id = f"FILE::{file_path}"
-            graph.add_node(
-                file_node_id, 
-                type="file", 
-                label=Path(file_path).name,
-                file=file_path
-            )
+    def _build_code_graph(self, chunks) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, List[str]]]:
+        """
+        Lean graph core: node attributes plus FILE -> entity adjacency lists
+        (every edge is CONTAINS). A networkx DiGraph is only built on demand.
+        """
+        node_attrs: Dict[str, Dict[str, Any]] = {}
+        adj: Dict[str, List[str]] = {}
         
-        # Add code entity nodes
         for chunk in chunks:
              meta = chunk["metadata"]
+             file_node_id = f"FILE::{meta['file_path']}"
+             if file_node_id not in adj:
+                 node_attrs[file_node_id] = {"type": "file", "label": Path(meta['file_path']).name, "file": meta['file_path']}
+                 adj[file_node_id] = []
              
-             # 1. Standard Tree-sitter Entities
-             if meta.get("chunk_type") in ["function", "class", "method"]:
-                 node_id = f"{meta['chunk_type']}::{meta['file_path']}::{meta['name']}"
-                 graph.add_node(
-                     node_id, 
-                     type=meta['chunk_type'],
-                     label=meta['name'],
-                     file=meta['file_path'],
-                     lines=f"{meta['start_line']}-{meta['end_line']}"
-                 )
-                 # Edge: File -> Entity
-                 file_node_id = f"FILE::{meta['file_path']}"
-                 if graph.has_node(file_node_id):
-                     graph.add_edge(file_node_id, node_id, type="CONTAINS")
-                     
-             # 2. Fallback Code Blocks (FIX: Include these too!)
-             elif meta.get("chunk_type") == "code_block":
-                 # Use a unique ID for code blocks
-                 # Format: CODE::FILE::ID
-                 chunk_id = chunk["id"] # It has ID from _create_chunk
-                 node_id = f"CODE_BLOCK::{chunk_id}"
-                 
-                 graph.add_node(
-                     node_id,
-                     type="code_block",
-                     label=meta['name'], # usually "file:chunk_N"
-                     file=meta['file_path'],
-                     lines=f"{meta['start_line']}-{meta['end_line']}" # might be 0-0 but better than nothing
-                 )
-                 
-                 file_node_id = f"FILE::{meta['file_path']}"
-                 if graph.has_node(file_node_id):
-                     graph.add_edge(file_node_id, node_id, type="CONTAINS")
+             # Tree-sitter entities, plus fallback code blocks keyed by chunk id
+             node_id = self._chunk_node_id(chunk)
+             if node_id is None:
+                 continue
+             if node_id not in node_attrs:
+                 adj[file_node_id].append(node_id)
+             node_attrs[node_id] = {
+                 "type": meta["chunk_type"],
+                 "label": meta['name'],
+                 "file": meta['file_path'],
+                 "lines": f"{meta['start_line']}-{meta['end_line']}"
+             }
+        
+        return node_attrs, adj
+
+    @staticmethod
+    def _to_node_link(node_attrs: Dict[str, Dict[str, Any]], adj: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Serialize the lean graph in networkx's node-link layout (as served to the frontend)."""
+        return {
+            "directed": True,
+            "multigraph": False,
+            "graph": {},
+            "nodes": [{**attrs, "id": node_id} for node_id, attrs in node_attrs.items()],
+            "edges": [
+                {"type": "CONTAINS", "source": source, "target": target}
+                for source, targets in adj.items() for target in targets
+            ]
+        }
+
+    @staticmethod
+    def _from_node_link(data: Dict[str, Any]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, List[str]]]:
+        node_attrs = {n["id"]: {k: v for k, v in n.items() if k != "id"} for n in data.get("nodes", [])}
+        adj: Dict[str, List[str]] = {}
+        # Older graph.json files were written by networkx with a "links" key
+        for edge in data.get("edges", data.get("links", [])):
+            adj.setdefault(edge["source"], []).append(edge["target"])
+        return node_attrs, adj
+    
+    @staticmethod
+    def _chunk_node_id(chunk) -> Optional[str]:
+        meta = chunk["metadata"]
+        chunk_type = meta.get("chunk_type")
+        if chunk_type in ("function", "class", "method"):
+            return f"{chunk_type}::{meta['file_path']}::{meta['name']}"
+        if chunk_type == "code_block":
+            return f"CODE_BLOCK::{chunk['id']}"
+        return None
+
+    def _graph_node_count(self, chunks) -> int:
+        """Node count the graph will have, without building it."""
+        node_ids = {f"FILE::{c['metadata']['file_path']}" for c in chunks}
+        node_ids.update(self._chunk_node_id(c) for c in chunks)
+        node_ids.discard(None)
+        return len(node_ids)
+
+    def _repo_graph(self, repo_id: str) -> Optional[Tuple[Dict[str, Dict[str, Any]], Dict[str, List[str]]]]:
+        """
+        Return the (node_attrs, adjacency) graph for a repo. The first call loads
+        graph.json, or builds it from the stored chunks and persists it; later calls hit the cache.
+        """
+        graph = self._graphs.get(repo_id)
+        if graph is not None:
+            return graph
+        
+        data_dir = self.repos_dir / f"data_{repo_id}"
+        graph_file = data_dir / "graph.json"
+        if graph_file.exists():
+            graph = self._from_node_link(_json_from_bytes(graph_file.read_bytes()))
+        else:
+            chunks = self.get_repo_chunks(repo_id)
+            if not chunks:
+                return None
+            print(f"🔗 Building code graph for {repo_id}...")
+            graph = self._build_code_graph(chunks)
+            graph_file.write_bytes(_json_bytes(self._to_node_link(*graph)))
+        
+        self._graphs[repo_id] = graph
+        return graph
+    
+    def _graphs_signature(self) -> str:
+        """Fingerprint of every repo's graph inputs (graph.json and chunk files, by mtime and size)."""
+        sig = hashlib.sha256()
+        for data_dir in sorted(self.repos_dir.glob("data_*")):
+            if not data_dir.is_dir():
+                continue
+            sig.update(data_dir.name.encode())
+            for name in ("graph.json", "chunks.msgpack", "chunks.json"):
+                try:
+                    st = (data_dir / name).stat()
+                    sig.update(f"|{name}:{st.st_mtime_ns}:{st.st_size}".encode())
+                except FileNotFoundError:
+                    sig.update(f"|{name}:-".encode())
+            sig.update(b"\n")
+        return sig.hexdigest()
     
     def load_all_graphs(self) -> nx.DiGraph:
-        """Load all persisted graphs from disk into memory"""
+        """
+        Load all persisted graphs from disk into one networkx graph (for the retriever).
+        The merged graph is pickled to all_graphs.pkl and reused until any repo's files change.
+        """
         print("🔄 Loading persisted code graphs...")
+        merged_file = self.repos_dir / "all_graphs.pkl"
+        try:
+            sig = self._graphs_signature()
+            if merged_file.exists():
+                with open(merged_file, "rb") as f:
+                    cached = pickle.load(f)
+                if cached.get("sig") == sig:
+                    combined_graph = cached["graph"]
+                    print(f"✅ Loaded {cached['count']} repository graphs (cached). Total nodes: {combined_graph.number_of_nodes()}")
+                    return combined_graph
+        except Exception as e:
+            print(f"⚠️ Ignoring merged graph cache: {e}")
+        
         combined_graph = nx.DiGraph()
         count = 0
         try:
@@ -505,64 +936,99 @@ class CodeIngestionService:
                 if not data_dir.is_dir():
                     continue
                 
-                graph_file = data_dir / "graph.json"
-                if graph_file.exists():
-                    try:
-                        with open(graph_file, "r") as f:
-                            data = json.load(f)
-                            # We can merge this into the main graph or keep separate?
-                            # For RAG, we might want a unified graph.
-                            # For visualization, we load per repo.
-                            # Let's merge into main graph to support global search if needed.
-                            # But beware of collisions.
-                            
-                            subgraph = nx.node_link_graph(data)
-                            combined_graph.update(subgraph)
-                            count += 1
-                    except Exception as e:
-                        print(f"Failed to load graph from {data_dir}: {e}")
+                repo_id = data_dir.name[len("data_"):]
+                try:
+                    # Merge into one graph to support global search; beware of collisions.
+                    graph = self._repo_graph(repo_id)
+                    if graph is not None:
+                        node_attrs, adj = graph
+                        combined_graph.add_nodes_from(node_attrs.items())
+                        combined_graph.add_edges_from(
+                            (source, target, {"type": "CONTAINS"})
+                            for source, targets in adj.items() for target in targets
+                        )
+                        count += 1
+                except Exception as e:
+                    print(f"Failed to load graph from {data_dir}: {e}")
             
             print(f"✅ Loaded {count} repository graphs. Total nodes: {combined_graph.number_of_nodes()}")
-            return combined_graph
         except Exception as e:
             print(f"Error loading graphs: {e}")
             return combined_graph
+        
+        # Signature is taken after the build, which may have written missing graph.json files
+        try:
+            tmp_file = merged_file.with_suffix(".pkl.tmp")
+            with open(tmp_file, "wb") as f:
+                pickle.dump(
+                    {"sig": self._graphs_signature(), "count": count, "graph": combined_graph},
+                    f, protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_file, merged_file)
+        except Exception as e:
+            print(f"⚠️ Failed to write merged graph cache: {e}")
+        return combined_graph
 
-    async def _save_repo_data(self, repo_id: str, chunks: List[Dict], graph: nx.DiGraph):
-        """Persist graph and chunks to disk"""
+    @contextmanager
+    def _repo_chunks_writer(self, repo_id: str, header: Dict[str, Any]):
+        """
+        Stream chunks into data_{repo_id}/chunks.msgpack, or chunks.json when msgpack
+        is not installed. Metadata shared by every chunk of the ingestion (`header`)
+        is stored once; each row keeps only its own fields (see get_repo_chunks).
+        The file is written under a temporary name and only replaces the old one on success.
+        """
         data_dir = self.repos_dir / f"data_{repo_id}"
         data_dir.mkdir(exist_ok=True)
+        chunks_name, stale_name = ("chunks.msgpack", "chunks.json") if MSGPACK_AVAILABLE else ("chunks.json", "chunks.msgpack")
+        chunks_file = data_dir / chunks_name
+        tmp_file = data_dir / f"{chunks_name}.tmp"
+        first = True
+        
+        def thin(chunk):
+            meta = {k: v for k, v in chunk["metadata"].items() if k not in header}
+            return {"id": chunk["id"], "text": chunk["text"], "metadata": meta}
         
-        # Save Chunks
-        with open(data_dir / "chunks.json", "w") as f:
-            json.dump(chunks, f, indent=2)
+        with open(tmp_file, "wb") as f:
+            if MSGPACK_AVAILABLE:
+                # {"header": ...} first, then one map per chunk row
+                packer = msgpack.Packer()
+                f.write(packer.pack({"header": header}))
+                def write_chunks(chunks: List[Dict[str, Any]]):
+                    for chunk in chunks:
+                        f.write(packer.pack(thin(chunk)))
+            else:
+                f.write(b'{"header":' + _json_bytes(header) + b',"rows":[')
+                def write_chunks(chunks: List[Dict[str, Any]]):
+                    nonlocal first
+                    for chunk in chunks:
+                        if not first:
+                            f.write(b",\n")
+                        f.write(_json_bytes(thin(chunk)))
+                        first = False
             
-        # Save Graph (node-link format)
-        # We need to save ONLY the subgraph relevant to this repo?
-        # self.graph currently holds ALL nodes if we don't clear it.
-        # But ingest_github_repo calls _build_code_graph which clears it first?
-        # YES: self.graph.clear() is called in _build_code_graph.
-        # So self.graph ONLY contains the current repo's graph during ingestion.
-        # This is correct for saving.
+            try:
+                yield write_chunks
+            except BaseException:
+                f.close()
+                tmp_file.unlink(missing_ok=True)
+                raise
+            if not MSGPACK_AVAILABLE:
+                f.write(b"]}")
+        
+        os.replace(tmp_file, chunks_file)
+        (data_dir / stale_name).unlink(missing_ok=True)
         
-        graph_data = nx.node_link_data(graph)
-        with open(data_dir / "graph.json", "w") as f:
-            json.dump(graph_data, f, indent=2)
+        # Drop any graph from a previous ingestion of this repo so it is rebuilt
+        self._graphs.pop(repo_id, None)
+        (data_dir / "graph.json").unlink(missing_ok=True)
             
     def get_repo_graph(self, repo_id: str) -> Dict[str, Any]:
         """Load and return graph data for frontend"""
         try:
-            # Check for data_{repo_id}
-            data_file = self.repos_dir / f"data_{repo_id}" / "graph.json"
-            
-            if not data_file.exists():
-                # Fallback: check if we have it in memory (for just ingested)
-                # But memory is transient.
+            graph = self._repo_graph(repo_id)
+            if graph is None:
                 return {"nodes": [], "edges": []}
-                
-            with open(data_file, "r") as f:
-                data = json.load(f)
-            return data
+            return self._to_node_link(*graph)
         except Exception as e:
             print(f"Error loading graph for {repo_id}: {e}")
             return {"nodes": [], "edges": []}
@@ -570,12 +1036,91 @@ class CodeIngestionService:
     def get_repo_chunks(self, repo_id: str) -> List[Dict[str, Any]]:
         """Load and return chunks"""
         try:
-            data_file = self.repos_dir / f"data_{repo_id}" / "chunks.json"
+            data_dir = self.repos_dir / f"data_{repo_id}"
+            packed_file = data_dir / "chunks.msgpack"
+            if MSGPACK_AVAILABLE and packed_file.exists():
+                with open(packed_file, "rb") as f:
+                    rows = list(msgpack.Unpacker(f, raw=False))
+                header = rows[0]["header"] if rows and "header" in rows[0] else None
+                return _with_header(header, rows[1:]) if header is not None else rows
+            
+            # No msgpack installed, or an older ingestion: chunks.json is either
+            # {"header": ..., "rows": [...]} or a plain list of full chunks
+            data_file = data_dir / "chunks.json"
             if not data_file.exists():
                 return []
-                
-            with open(data_file, "r") as f:
-                return json.load(f)
+            data = _json_from_bytes(data_file.read_bytes())
+            if isinstance(data, dict):
+                return _with_header(data["header"], data["rows"])
+            return data
         except Exception as e:
             print(f"Error loading chunks for {repo_id}: {e}")
             return []
+
+
+def _with_header(header: Dict[str, Any], rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Rebuild full chunks from thin persisted rows plus the shared metadata header."""
+    for row in rows:
+        row["metadata"] = {**header, **row["metadata"]}
+    return rows
+
+
+def _extract_zipball(archive, dest: Path) -> None:
+    """Extract a GitHub zipball into dest, dropping its top-level folder and rejecting Zip Slip paths."""
+    dest.mkdir(parents=True, exist_ok=True)
+    root = dest.resolve()
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            # Entries are "<owner>-<repo>-<sha>/<path>"
+            _, _, relative = info.filename.partition("/")
+            if not relative:
+                continue
+            target = (root / relative).resolve()
+            if not target.is_relative_to(root):
+                raise ValueError(f"Unsafe path in archive: {info.filename}")
+            if info.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with zf.open(info) as src, open(target, "wb") as out:
+                shutil.copyfileobj(src, out)
+
+
+def _json_bytes(obj: Any) -> bytes:
+    """Serialize to compact JSON bytes, preferring orjson when installed"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def _json_from_bytes(data: bytes) -> Any:
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _decode(content_bytes) -> str:
+    # str() accepts any buffer, including mmap objects
+    return str(content_bytes, 'utf-8', errors='ignore')
+
+
+def _match_node(match: Dict[str, Any], capture_name: str):
+    """First node for a capture in a query match (values are a Node or a list of Nodes)."""
+    nodes = match.get(capture_name)
+    if isinstance(nodes, list):
+        return nodes[0] if nodes else None
+    return nodes
+
+
+# Per-process service used by parse pool workers. Tree-sitter Language/Parser
+# objects are not picklable, so each worker loads its own parsers once.
+_WORKER_SERVICE: Optional[CodeIngestionService] = None
+
+
+def _parse_files_worker(repos_dir: str, file_paths: List[str], repo_path: str, repo_name: str, user_id: str) -> List[Optional[List[Dict[str, Any]]]]:
+    """Process pool entry point: parse a batch of files into per-file chunk lists."""
+    global _WORKER_SERVICE
+    if _WORKER_SERVICE is None:
+        _WORKER_SERVICE = CodeIngestionService(repos_dir=repos_dir)
+    root = Path(repo_path)
+    return [_WORKER_SERVICE._parse_file(Path(f), root, repo_name, user_id) for f in file_paths]
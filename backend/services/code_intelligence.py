@@ -4,13 +4,382 @@ AST-based code indexing and semantic search for legacy codebases
 """
 
 import asyncio
-from typing import List, Dict, Any, Optional
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import ast
+import base64
+import io
+import os
+import sys
+import tokenize
+import hashlib
+import pickle
+import sqlite3
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
 
+# Compressed snippet metadata (optional, falls back to plain-text snippets)
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Extracted entities depend on the interpreter's ast module and on _EntityExtractor;
+# a Python upgrade or a bump of ENTITY_FORMAT invalidates cached entries
+ENTITY_FORMAT = "4"
+PY_VERSION = f"{sys.version_info.major}.{sys.version_info.minor}:{ENTITY_FORMAT}"
+
+
+class AstCache:
+    """
+    Persistent cache of extracted entities per file.
+    Maps (relative path, sha256(source), PY_VERSION) -> entities list, stored as pickle.
+    Each row also records the source file's (path, mtime_ns, size) when last seen,
+    so unchanged files are recognised from os.stat alone, without reading them.
+    """
+    
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        # Small-codebase indexing runs on default-executor threads; the lock serializes the shared connection
+        self._lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ast_cache (
+                    path TEXT NOT NULL,
+                    sha TEXT NOT NULL,
+                    py_version TEXT NOT NULL,
+                    entities BLOB NOT NULL,
+                    source_path TEXT,
+                    mtime_ns INTEGER,
+                    size INTEGER,
+                    PRIMARY KEY (path, sha, py_version)
+                )
+            """)
+            # Caches created before the stat columns existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(ast_cache)")}
+            for column, sql_type in (("source_path", "TEXT"), ("mtime_ns", "INTEGER"), ("size", "INTEGER")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE ast_cache ADD COLUMN {column} {sql_type}")
+            self._conn = conn
+        return self._conn
+    
+    def get(self, path: str, sha: str) -> Optional[List[Dict[str, Any]]]:
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT entities FROM ast_cache WHERE path = ? AND sha = ? AND py_version = ?",
+                    (path, sha, PY_VERSION)
+                ).fetchone()
+            return pickle.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"⚠️ AST cache read failed: {e}")
+            return None
+    
+    def get_by_stat(self, path: str, stat_key: Tuple[str, int, int]) -> Optional[List[Dict[str, Any]]]:
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT entities FROM ast_cache WHERE path = ? AND py_version = ? AND source_path = ? AND mtime_ns = ? AND size = ?",
+                    (path, PY_VERSION, *stat_key)
+                ).fetchone()
+            return pickle.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"⚠️ AST cache read failed: {e}")
+            return None
+    
+    def put(self, path: str, sha: str, entities: List[Dict[str, Any]], stat_key: Tuple[str, int, int]) -> None:
+        try:
+            blob = pickle.dumps(entities, protocol=pickle.HIGHEST_PROTOCOL)
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO ast_cache (path, sha, py_version, entities, source_path, mtime_ns, size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (path, sha, PY_VERSION, blob, *stat_key)
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"⚠️ AST cache write failed: {e}")
+    
+    def record_stat(self, path: str, sha: str, stat_key: Tuple[str, int, int]) -> None:
+        """Remember the file's current stat for an entry found by content (e.g. after a touch)."""
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "UPDATE ast_cache SET source_path = ?, mtime_ns = ?, size = ? WHERE path = ? AND sha = ? AND py_version = ?",
+                    (*stat_key, path, sha, PY_VERSION)
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"⚠️ AST cache write failed: {e}")
+
+
+class SnippetCodec:
+    """
+    zstd-compresses snippet metadata ("snippet" -> base85 "snippet_z") with a dictionary
+    trained on the first indexed codebase. The dictionary is kept next to the Chroma
+    store for good: stored frames cannot be decoded without it.
+    """
+    
+    DICT_SIZE = 16384
+    MIN_TRAINING_SAMPLES = 128
+    
+    def __init__(self, dict_path: Path):
+        self.dict_path = dict_path
+        self._dict = None
+        self._compressor = None
+        self._decompressor = None
+        if ZSTD_AVAILABLE and dict_path.exists():
+            self._dict = zstandard.ZstdCompressionDict(dict_path.read_bytes())
+    
+    def train(self, snippets: List[str]) -> None:
+        """Train and persist the dictionary once, if there is not one already."""
+        if not ZSTD_AVAILABLE or self._dict is not None or len(snippets) < self.MIN_TRAINING_SAMPLES:
+            return
+        try:
+            trained = zstandard.train_dictionary(self.DICT_SIZE, [s.encode('utf-8') for s in snippets])
+        except zstandard.ZstdError as e:
+            print(f"⚠️ Snippet dictionary training failed: {e}")
+            return
+        tmp_path = self.dict_path.with_suffix(".tmp")
+        tmp_path.write_bytes(trained.as_bytes())
+        os.replace(tmp_path, self.dict_path)
+        self._dict = trained
+        self._compressor = self._decompressor = None
+        print(f"🗜️ Trained snippet dictionary on {len(snippets)} snippets")
+    
+    def encode(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        snippet = metadata.get("snippet")
+        if not ZSTD_AVAILABLE or not snippet:
+            return metadata
+        if self._compressor is None:
+            self._compressor = zstandard.ZstdCompressor(level=3, dict_data=self._dict)
+        packed = base64.b85encode(self._compressor.compress(snippet.encode('utf-8'))).decode('ascii')
+        if len(packed) >= len(snippet):
+            return metadata
+        encoded = {k: v for k, v in metadata.items() if k != "snippet"}
+        encoded["snippet_z"] = packed
+        return encoded
+    
+    def decode(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        packed = metadata.get("snippet_z")
+        if packed is None:
+            return metadata
+        decoded = {k: v for k, v in metadata.items() if k != "snippet_z"}
+        try:
+            if self._decompressor is None:
+                self._decompressor = zstandard.ZstdDecompressor(dict_data=self._dict)
+            decoded["snippet"] = self._decompressor.decompress(base64.b85decode(packed)).decode('utf-8')
+        except Exception as e:
+            print(f"⚠️ Could not decode snippet: {e}")
+        return decoded
+
+
+class QuantizedEmbeddingFunction(embedding_functions.SentenceTransformerEmbeddingFunction):
+    """
+    SentenceTransformer embeddings at reduced precision: FP16 on a CUDA GPU,
+    otherwise dynamically INT8-quantized Linear layers on CPU.
+    Falls back to the FP32 CPU model if torch quantization is unavailable.
+    """
+    
+    CPU_BATCH_SIZE = 32  # sentence-transformers default
+    GPU_BATCH_SIZE = 512
+    
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        self._batch_size = self.CPU_BATCH_SIZE
+        try:
+            import torch
+            cuda = torch.cuda.is_available()
+        except Exception:
+            cuda = False
+        
+        if cuda:
+            try:
+                from sentence_transformers import SentenceTransformer
+                # Own instance: chromadb's shared model cache would hand back a CPU copy
+                self._model = SentenceTransformer(model_name, device="cuda").half()
+                self._normalize_embeddings = False
+                self._batch_size = self.GPU_BATCH_SIZE
+                print(f"🚀 Code embeddings on GPU (FP16): {torch.cuda.get_device_name(0)}")
+                return
+            except Exception as e:
+                print(f"⚠️ GPU embeddings unavailable, using CPU: {e}")
+        
+        super().__init__(model_name=model_name)
+        try:
+            import torch
+            # quantize_dynamic returns a copy; chromadb's shared FP32 model is left untouched
+            self._model = torch.quantization.quantize_dynamic(
+                self._model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        except Exception as e:
+            print(f"⚠️ INT8 quantization unavailable, using FP32 embeddings: {e}")
+    
+    def __call__(self, input):
+        return self._model.encode(
+            list(input),
+            batch_size=self._batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=self._normalize_embeddings,
+        ).tolist()
+
+
+class _EntityExtractor:
+    """
+    Collects classes, their methods and top-level functions in one traversal.
+    Only statement bodies are walked: expressions and function bodies are
+    never descended into, so nested defs are not indexed.
+    """
+    
+    SNIPPET_CHARS = 500  # Limit snippet size
+    VECTORIZED_INDEX_MIN = 4096  # bytes; smaller files are indexed with a plain find() loop
+    
+    # Statement blocks that can hold defs (if/try/with/for/while at module or class level)
+    BLOCK_FIELDS = ('body', 'orelse', 'finalbody')
+    
+    def __init__(self, file_path: str, source: bytes, encoding: Optional[str] = None):
+        self.file_path = file_path
+        self.source = source
+        self.encoding = encoding
+        self._line_starts = None  # list, or numpy array for large files
+        self._class_scope: List[str] = []  # enclosing class names, for qualified IDs
+        self.entities: List[Dict[str, Any]] = []
+    
+    def _span(self, node: ast.AST) -> Tuple[int, int]:
+        """Byte range of the node's lines (without the trailing newline)."""
+        # Index line offsets lazily: files without any entities never scan for newlines
+        if self._line_starts is None:
+            source = self.source
+            if len(source) >= self.VECTORIZED_INDEX_MIN:
+                # One vectorized byte scan instead of a Python-level find() per line
+                newlines = np.flatnonzero(np.frombuffer(source, dtype=np.uint8) == 10)
+                self._line_starts = np.concatenate(([0], newlines + 1))
+            else:
+                starts = [0]
+                i = source.find(b'\n')
+                while i != -1:
+                    starts.append(i + 1)
+                    i = source.find(b'\n', i + 1)
+                self._line_starts = starts
+        starts = self._line_starts
+        end_lineno = getattr(node, 'end_lineno', None) or node.lineno
+        end = starts[end_lineno] - 1 if end_lineno < len(starts) else len(self.source)
+        return starts[node.lineno - 1], end
+    
+    def _snippet(self, node: ast.AST) -> str:
+        """Source of the node's lines, truncated to SNIPPET_CHARS."""
+        if getattr(node, 'end_lineno', None) is None:
+            return ""
+        if self.encoding is None:
+            self.encoding = tokenize.detect_encoding(io.BytesIO(self.source).readline)[0]
+        start, end = self._span(node)
+        # Decode only the entity's bytes, and no more than the snippet can hold (<= 4 bytes/char)
+        if end - start <= self.SNIPPET_CHARS:
+            return self.source[start:end].decode(self.encoding, errors='replace')
+        end = min(end, start + 4 * self.SNIPPET_CHARS)
+        return self.source[start:end].decode(self.encoding, errors='replace')[:self.SNIPPET_CHARS]
+    
+    def visit(self, tree: ast.Module):
+        self._visit_body(tree.body)
+    
+    def _visit_body(self, body: List[ast.stmt]):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                self.visit_FunctionDef(node)
+            elif isinstance(node, ast.ClassDef):
+                self.visit_ClassDef(node)
+            else:
+                # Compound statements: defs under `if TYPE_CHECKING:`, `try: ... except ImportError:` etc.
+                for field in self.BLOCK_FIELDS:
+                    block = getattr(node, field, None)
+                    if block:
+                        self._visit_body(block)
+                for clause in getattr(node, 'handlers', None) or getattr(node, 'cases', None) or ():
+                    self._visit_body(clause.body)
+    
+    def _entity_id(self, node: ast.AST, kind: str = "") -> str:
+        """Content-addressed ID: unchanged code keeps its ID (and embedding) when it moves."""
+        start, end = self._span(node)
+        digest = hashlib.sha256(self.source[start:end]).hexdigest()[:16]
+        qualname = '.'.join(self._class_scope + [node.name])
+        return f"{self.file_path}::{qualname}::{kind}{digest}"
+    
+    def visit_FunctionDef(self, node):
+        # Get function signature
+        args = [arg.arg for arg in node.args.args]
+        signature = f"{node.name}({', '.join(args)})"
+        
+        # Get docstring
+        docstring = ast.get_docstring(node) or "No documentation"
+        
+        # Get source code snippet
+        snippet = self._snippet(node)
+        
+        # Create searchable description
+        description = f"Function: {signature}\n{docstring}\nFile: {self.file_path}"
+        
+        entity_id = self._entity_id(node)
+        
+        self.entities.append({
+            "id": entity_id,
+            "description": description,
+            "metadata": {
+                "type": "function",
+                "name": node.name,
+                "signature": signature,
+                "file_path": self.file_path,
+                "line_start": node.lineno if hasattr(node, 'lineno') else 0,
+                "line_end": node.end_lineno if hasattr(node, 'end_lineno') else 0,
+                "docstring": docstring,
+                "snippet": snippet
+            }
+        })
+        # Function bodies are not descended into: nested defs are not indexed
+    
+    def visit_ClassDef(self, node):
+        # Get class info
+        bases = ", ".join(base.id if isinstance(base, ast.Name) else str(base) for base in node.bases)
+        docstring = ast.get_docstring(node) or "No documentation"
+        
+        # Get methods
+        # (comma-joined: Chroma metadata values must be scalars, a list fails the whole add)
+        methods = ", ".join(n.name for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)))
+        
+        description = f"Class: {node.name}\nInherits: {bases or 'None'}\nMethods: {methods}\n{docstring}\nFile: {self.file_path}"
+        
+        entity_id = self._entity_id(node, "CLASS::")
+        
+        self.entities.append({
+            "id": entity_id,
+            "description": description,
+            "metadata": {
+                "type": "class",
+                "name": node.name,
+                "bases": bases,
+                "methods": methods,
+                "file_path": self.file_path,
+                "line_start": node.lineno if hasattr(node, 'lineno') else 0,
+                "docstring": docstring
+            }
+        })
+        # Methods and nested classes
+        self._class_scope.append(node.name)
+        self._visit_body(node.body)
+        self._class_scope.pop()
+
 
 class CodeIntelligence:
     """
@@ -20,6 +389,9 @@ class CodeIntelligence:
     - Semantic code search
     """
     
+    PARALLEL_MIN_FILES = 64  # smaller codebases are parsed in-process
+    ADD_BATCH_SIZE = 256  # entities per collection.add (one embedding batch)
+    
     def __init__(
         self,
         collection_name: str = "codebase_index",
@@ -28,10 +400,14 @@ class CodeIntelligence:
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(path=persist_directory)
         
-        # Embedding function
-        self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
+        # Extracted entities survive restarts; unchanged files skip ast.parse on re-index
+        self._ast_cache = AstCache(Path(persist_directory) / "ast_cache.sqlite")
+        
+        # Snippets are stored zstd-compressed in Chroma metadata
+        self._snippet_codec = SnippetCodec(Path(persist_directory) / "snippets.zdict")
+        
+        # Embedding function (INT8 MatMuls: ~2x CPU throughput, negligible recall loss)
+        self.embedding_function = QuantizedEmbeddingFunction(model_name="all-MiniLM-L6-v2")
         
         # Get or create collection
         try:
@@ -59,50 +435,122 @@ class CodeIntelligence:
         if not codebase_path.exists():
             return {"status": "error", "message": f"Path not found: {path}"}
         
-        # Find all Python files
-        python_files = list(codebase_path.rglob("*.py"))
+        # Find all Python files (with their stat, for the AST cache's unchanged-file check)
+        root = str(codebase_path)
+        python_files = list(_iter_py_files(root))
         
-        total_functions = 0
-        total_classes = 0
+        prefix_len = len(os.path.join(root, ''))
+        relative_paths = [py_file[prefix_len:] for py_file, _ in python_files]
+        stat_keys = [(py_file, st.st_mtime_ns, st.st_size) for py_file, st in python_files]
         
-        for py_file in python_files:
-            try:
-                with open(py_file, 'r', encoding='utf-8') as f:
-                    source_code = f.read()
-                
-                # Parse AST
-                tree = ast.parse(source_code)
-                
-                # Extract code entities
-                entities = self._extract_code_entities(
-                    tree,
-                    str(py_file.relative_to(codebase_path)),
-                    source_code
-                )
-                
-                if entities:
-                    # Add to collection
-                    self.collection.add(
-                        documents=[e["description"] for e in entities],
-                        metadatas=[e["metadata"] for e in entities],
-                        ids=[e["id"] for e in entities]
-                    )
-                    
-                    total_functions += sum(1 for e in entities if e["metadata"]["type"] == "function")
-                    total_classes += sum(1 for e in entities if e["metadata"]["type"] == "class")
-            
-            except Exception as e:
-                print(f"  ⚠️  Error parsing {py_file.name}: {e}")
+        # Parsing is CPU-bound: fan out across processes unless the codebase is small
+        # enough that spawning workers would cost more than it saves
+        if len(python_files) >= self.PARALLEL_MIN_FILES:
+            with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as pool:
+                results = await asyncio.to_thread(list, pool.map(
+                    _index_file_worker,
+                    repeat(str(self._ast_cache.db_path)),
+                    relative_paths,
+                    stat_keys,
+                    chunksize=16
+                ))
+        else:
+            # Still off the event loop: reading and parsing every file blocks for the whole index
+            results = await asyncio.to_thread(list, map(
+                _load_file_entities,
+                repeat(self._ast_cache),
+                relative_paths,
+                stat_keys
+            ))
+        
+        # IDs are content hashes: identical same-named defs in one file collapse to one entity
+        all_entities = list({e["id"]: e for entities in results if entities for e in entities}.values())
+        self._snippet_codec.train([e["metadata"]["snippet"] for e in all_entities if e["metadata"].get("snippet")])
+        
+        # Add across file boundaries in fixed-size batches so embeddings run in large batches
+        indexed: List[Dict[str, Any]] = []
+        failed: List[Dict[str, Any]] = []
+        for i in range(0, len(all_entities), self.ADD_BATCH_SIZE):
+            self._add_entity_batch(all_entities[i:i + self.ADD_BATCH_SIZE], indexed, failed)
+        
+        # An edited def gets a new ID (content hash): drop the versions it superseded.
+        # Files that failed to parse or to add keep their previous entities.
+        failed_files = {e["metadata"]["file_path"] for e in failed}
+        self._delete_stale_entities(
+            [path for path, entities in zip(relative_paths, results)
+             if entities is not None and path not in failed_files],
+            {e["id"] for e in all_entities}
+        )
+        
+        total_functions = sum(1 for e in indexed if e["metadata"]["type"] == "function")
+        total_classes = sum(1 for e in indexed if e["metadata"]["type"] == "class")
         
         print(f"✅ Indexed {total_functions} functions and {total_classes} classes from {len(python_files)} files")
+        if failed:
+            print(f"  ⚠️  {len(failed)} entities could not be indexed")
         
         return {
             "status": "success",
             "files_processed": len(python_files),
             "functions_indexed": total_functions,
-            "classes_indexed": total_classes
+            "classes_indexed": total_classes,
+            "entities_failed": len(failed)
         }
     
+    def _delete_stale_entities(self, file_paths: List[str], current_ids: set) -> None:
+        """Delete entities of the re-indexed files whose IDs are not in current_ids"""
+        stale = 0
+        for i in range(0, len(file_paths), self.ADD_BATCH_SIZE):
+            try:
+                stored = self.collection.get(
+                    where={"file_path": {"$in": file_paths[i:i + self.ADD_BATCH_SIZE]}},
+                    include=[]
+                )["ids"]
+                stale_ids = [entity_id for entity_id in stored if entity_id not in current_ids]
+                if stale_ids:
+                    self.collection.delete(ids=stale_ids)
+                    stale += len(stale_ids)
+            except Exception as e:
+                print(f"  ⚠️  Error removing superseded entities: {e}")
+        if stale:
+            print(f"🧹 Removed {stale} superseded entities")
+    
+    def _add_entity_batch(
+        self,
+        batch: List[Dict[str, Any]],
+        indexed: List[Dict[str, Any]],
+        failed: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Add (or refresh) a batch of entities, appending each to indexed or failed.
+        A rejected batch is split in halves, so one bad entity only loses itself.
+        """
+        try:
+            # Unchanged code is already embedded; only refresh its metadata (line numbers)
+            existing = set(self.collection.get(ids=[e["id"] for e in batch], include=[])["ids"])
+            fresh = [e for e in batch if e["id"] not in existing]
+            if fresh:
+                self.collection.add(
+                    documents=[e["description"] for e in fresh],
+                    metadatas=[self._snippet_codec.encode(e["metadata"]) for e in fresh],
+                    ids=[e["id"] for e in fresh]
+                )
+            if existing:
+                known = [e for e in batch if e["id"] in existing]
+                self.collection.update(
+                    ids=[e["id"] for e in known],
+                    metadatas=[self._snippet_codec.encode(e["metadata"]) for e in known]
+                )
+            indexed.extend(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                print(f"  ⚠️  Error adding {batch[0]['id']} to collection: {e}")
+                failed.extend(batch)
+                return
+            mid = len(batch) // 2
+            self._add_entity_batch(batch[:mid], indexed, failed)
+            self._add_entity_batch(batch[mid:], indexed, failed)
+    
     def _extract_code_entities(
         self,
         tree: ast.AST,
@@ -112,73 +560,9 @@ class CodeIntelligence:
         """
         Extract functions and classes from AST
         """
-        entities = []
-        source_lines = source_code.split('\n')
-        
-        for node in ast.walk(tree):
-            # Extract functions
-            if isinstance(node, ast.FunctionDef):
-                # Get function signature
-                args = [arg.arg for arg in node.args.args]
-                signature = f"{node.name}({', '.join(args)})"
-                
-                # Get docstring
-                docstring = ast.get_docstring(node) or "No documentation"
-                
-                # Get source code snippet
-                if hasattr(node, 'lineno') and hasattr(node, 'end_lineno'):
-                    snippet = '\n'.join(source_lines[node.lineno-1:node.end_lineno])
-                else:
-                    snippet = ""
-                
-                # Create searchable description
-                description = f"Function: {signature}\n{docstring}\nFile: {file_path}"
-                
-                entity_id = f"{file_path}::{node.name}::L{node.lineno}"
-                
-                entities.append({
-                    "id": entity_id,
-                    "description": description,
-                    "metadata": {
-                        "type": "function",
-                        "name": node.name,
-                        "signature": signature,
-                        "file_path": file_path,
-                        "line_start": node.lineno if hasattr(node, 'lineno') else 0,
-                        "line_end": node.end_lineno if hasattr(node, 'end_lineno') else 0,
-                        "docstring": docstring,
-                        "snippet": snippet[:500]  # Limit snippet size
-                    }
-                })
-            
-            # Extract classes
-            elif isinstance(node, ast.ClassDef):
-                # Get class info
-                bases = [base.id if isinstance(base, ast.Name) else str(base) for base in node.bases]
-                docstring = ast.get_docstring(node) or "No documentation"
-                
-                # Get methods
-                methods = [n.name for n in node.body if isinstance(n, ast.FunctionDef)]
-                
-                description = f"Class: {node.name}\nInherits: {', '.join(bases) if bases else 'None'}\nMethods: {', '.join(methods)}\n{docstring}\nFile: {file_path}"
-                
-                entity_id = f"{file_path}::{node.name}::CLASS::L{node.lineno}"
-                
-                entities.append({
-                    "id": entity_id,
-                    "description": description,
-                    "metadata": {
-                        "type": "class",
-                        "name": node.name,
-                        "bases": bases,
-                        "methods": methods,
-                        "file_path": file_path,
-                        "line_start": node.lineno if hasattr(node, 'lineno') else 0,
-                        "docstring": docstring
-                    }
-                })
-        
-        return entities
+        extractor = _EntityExtractor(file_path, source_code.encode('utf-8'), encoding='utf-8')
+        extractor.visit(tree)
+        return extractor.entities
     
     async def search(
         self,
@@ -202,7 +586,7 @@ class CodeIntelligence:
             
             if results["documents"] and results["documents"][0]:
                 for i in range(len(results["documents"][0])):
-                    metadata = results["metadatas"][0][i]
+                    metadata = self._snippet_codec.decode(results["metadatas"][0][i])
                     
                     chunks.append({
                         "text": f"```python\n{metadata.get('snippet', 'No code available')}\n```\n\nLocation: {metadata.get('file_path')} (Lines {metadata.get('line_start')}-{metadata.get('line_end')})\n\n{results['documents'][0][i]}",
@@ -226,3 +610,70 @@ class CodeIntelligence:
         except Exception as e:
             print(f"Error searching code: {e}")
             return {"chunks": [], "sources": [], "total_found": 0}
+
+
+def _iter_py_files(root: str):
+    """
+    Walk the tree with os.scandir, yielding (path, stat_result) for every .py file.
+    Symlinked directories are not followed.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.py') and entry.is_file():
+                        yield entry.path, entry.stat()
+        except OSError as e:
+            print(f"  ⚠️  Skipping unreadable directory {directory}: {e}")
+
+
+def _load_file_entities(cache: AstCache, relative_path: str, stat_key: Tuple[str, int, int]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Read, parse and extract one file, going through the AST cache. Returns None on error.
+    stat_key is the file's (path, mtime_ns, size) as seen by the directory walk.
+    """
+    py_file = stat_key[0]
+    try:
+        # Unchanged since last seen (same mtime and size): skip reading the file at all
+        entities = cache.get_by_stat(relative_path, stat_key)
+        if entities is not None:
+            return entities
+        
+        with open(py_file, 'rb') as f:
+            source_bytes = f.read()
+        
+        digest = hashlib.sha256(source_bytes).hexdigest()
+        entities = cache.get(relative_path, digest)
+        if entities is not None:
+            # Touched but not edited
+            cache.record_stat(relative_path, digest, stat_key)
+        else:
+            # Parse AST straight from bytes (honours PEP 263 encoding cookies); AST only,
+            # no type comments, no inherited __future__ flags
+            tree = compile(source_bytes, relative_path, 'exec', flags=ast.PyCF_ONLY_AST, dont_inherit=True)
+            
+            # Extract code entities; snippets are decoded per entity
+            extractor = _EntityExtractor(relative_path, source_bytes)
+            extractor.visit(tree)
+            entities = extractor.entities
+            cache.put(relative_path, digest, entities, stat_key)
+        return entities
+    except Exception as e:
+        print(f"  ⚠️  Error parsing {Path(py_file).name}: {e}")
+        return None
+
+
+# Per-process AST cache connection for pool workers
+_WORKER_CACHE: Optional[AstCache] = None
+
+
+def _index_file_worker(cache_path: str, relative_path: str, stat_key: Tuple[str, int, int]) -> Optional[List[Dict[str, Any]]]:
+    """Process pool entry point: entities for one file."""
+    global _WORKER_CACHE
+    if _WORKER_CACHE is None:
+        _WORKER_CACHE = AstCache(Path(cache_path))
+    return _load_file_entities(_WORKER_CACHE, relative_path, stat_key)
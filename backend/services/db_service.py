@@ -8,11 +8,61 @@ SQLite implementation for:
 
 import sqlite3
 import json
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import uuid
 
+# Fast JSON (optional)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Statements issued on hot or shared paths. One string per statement keeps them
+# hitting the connection's prepared-statement cache.
+_INSERT_AUDIT_LOG = "INSERT INTO audit_logs (id, timestamp, actor, action_type, status, details, trace_id) VALUES (?, ?, ?, ?, ?, ?, ?)"
+_INSERT_CONVERSATION = "INSERT INTO conversations (id, user_id, role, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)"
+_TOUCH_CONVERSATION = "UPDATE conversations SET updated_at = ? WHERE id = ?"
+_INSERT_MESSAGE = "INSERT INTO messages (conversation_id, role, content, metadata, created_at) VALUES (?, ?, ?, ?, ?)"
+
+
+def _dumps(obj: Any) -> str:
+    """Serialize a JSON column value, preferring orjson when installed"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj)
+
+
+def _loads(data: str) -> Any:
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _fetch_dicts(cursor) -> List[Dict[str, Any]]:
+    """All remaining rows as dicts; column names are read once per query."""
+    cols = [d[0] for d in cursor.description]
+    return [dict(zip(cols, row)) for row in cursor.fetchall()]
+
+
+def _fetch_dict(cursor) -> Optional[Dict[str, Any]]:
+    row = cursor.fetchone()
+    return dict(zip([d[0] for d in cursor.description], row)) if row else None
+
+
+def _in_thread(method):
+    """Run a blocking DB method in a worker thread; callers still await it."""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await asyncio.to_thread(method, self, *args, **kwargs)
+    return wrapper
+
 
 class DatabaseService:
     def __init__(self, db_path: Optional[str] = None):
@@ -21,18 +71,36 @@ class DatabaseService:
         else:
             self.db_path = db_path
         
+        # One long-lived connection shared by all calls; the lock serializes access to it
+        self._lock = threading.Lock()
+        self._conn = self._get_connection()
         self._init_db()
 
     def _get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL;")  # Enable Write-Ahead Logging for concurrency
+        conn.execute("PRAGMA synchronous=NORMAL;")  # WAL stays consistent; fsync only at checkpoints
+        conn.execute("PRAGMA temp_store=MEMORY;")
+        conn.execute("PRAGMA cache_size=-65536;")  # 64 MiB page cache
         return conn
 
+    @contextmanager
+    def _cursor(self):
+        """Cursor on the shared connection; commits on success, rolls back on error."""
+        with self._lock:
+            cursor = self._conn.cursor()
+            try:
+                yield cursor
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
     def _init_db(self):
         """Initialize all database tables"""
-        conn = self._get_connection()
-        conn.execute("PRAGMA journal_mode=WAL;")  # Enable Write-Ahead Logging for concurrency
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
         
         # ==================== EXISTING TABLES ====================
         
@@ -135,6 +203,21 @@ class DatabaseService:
             ON user_documents(user_id, uploaded_at DESC)
         """)
         
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tickets_created 
+            ON tickets(created_at DESC)
+        """)
+        
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_audit_ts 
+            ON audit_logs(timestamp DESC)
+        """)
+        
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_audit_trace 
+            ON audit_logs(trace_id)
+        """)
+        
         # Repositories Table (codebases)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS repositories (
@@ -157,110 +240,107 @@ class DatabaseService:
             ON repositories(user_id, last_indexed_at DESC)
         """)
         
-        conn.commit()
-        conn.close()
+        self._conn.commit()
 
     # ==================== TICKETS ====================
     
-    async def create_ticket(self, ticket_data: Dict[str, Any]) -> Dict[str, Any]:
+    @_in_thread
+    def create_ticket(self, ticket_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new Jira ticket"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        ticket_id = ticket_data["ticket_id"]
-        
-        cursor.execute(
-            "INSERT INTO tickets (id, title, description, priority, assignee, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (
-                ticket_id,
-                ticket_data["title"],
-                ticket_data.get("description", ""),
-                ticket_data.get("priority", "Medium"),
-                ticket_data.get("assignee", "Unassigned"),
-                ticket_data.get("status", "TO DO"),
-                ticket_data.get("created_at", datetime.now().isoformat())
+        with self._cursor() as cursor:
+            ticket_id = ticket_data["ticket_id"]
+            
+            cursor.execute(
+                "INSERT INTO tickets (id, title, description, priority, assignee, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    ticket_id,
+                    ticket_data["title"],
+                    ticket_data.get("description", ""),
+                    ticket_data.get("priority", "Medium"),
+                    ticket_data.get("assignee", "Unassigned"),
+                    ticket_data.get("status", "TO DO"),
+                    ticket_data.get("created_at", datetime.now().isoformat())
+                )
             )
-        )
-        conn.commit()
-        conn.close()
         return ticket_data
 
-    async def get_tickets(self, limit: int = 10) -> List[Dict[str, Any]]:
+    @_in_thread
+    def get_tickets(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent tickets"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM tickets ORDER BY created_at DESC LIMIT ?", (limit,))
-        rows = cursor.fetchall()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute("SELECT * FROM tickets ORDER BY created_at DESC LIMIT ?", (limit,))
+            rows = _fetch_dicts(cursor)
         
-        return [dict(row) for row in rows]
+        return rows
 
     # ==================== MEETINGS ====================
     
-    async def create_meeting(self, meeting_data: Dict[str, Any]) -> Dict[str, Any]:
+    @_in_thread
+    def create_meeting(self, meeting_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new meeting"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        participants_json = json.dumps(meeting_data.get("participants", []))
-        
-        cursor.execute(
-            "INSERT INTO meetings (title, participants, duration, scheduled_time, status) VALUES (?, ?, ?, ?, ?)",
-            (
-                meeting_data["title"],
-                participants_json,
-                meeting_data.get("duration", 30),
-                meeting_data.get("scheduled_time", ""),
-                meeting_data.get("status", "SCHEDULED")
+        with self._cursor() as cursor:
+            participants_json = _dumps(meeting_data.get("participants", []))
+            
+            cursor.execute(
+                "INSERT INTO meetings (title, participants, duration, scheduled_time, status) VALUES (?, ?, ?, ?, ?)",
+                (
+                    meeting_data["title"],
+                    participants_json,
+                    meeting_data.get("duration", 30),
+                    meeting_data.get("scheduled_time", ""),
+                    meeting_data.get("status", "SCHEDULED")
+                )
             )
-        )
-        meeting_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+            meeting_id = cursor.lastrowid
         
         meeting_data["id"] = meeting_id
         return meeting_data
 
     # ==================== AUDIT LOGS ====================
     
-    async def log_event(self, log_entry: Dict[str, Any]):
+    @_in_thread
+    def log_event(self, log_entry: Dict[str, Any]):
         """Log an audit event"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        details_json = json.dumps(log_entry.get("details", {})) if isinstance(log_entry.get("details"), dict) else log_entry.get("details", "")
-        
-        cursor.execute(
-            "INSERT INTO audit_logs (id, timestamp, actor, action_type, status, details, trace_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (
-                log_entry["id"],
-                log_entry["timestamp"],
-                log_entry["actor"],
-                log_entry["action_type"],
-                log_entry["status"],
-                details_json,
-                log_entry.get("trace_id", "")
+        with self._cursor() as cursor:
+            cursor.execute(
+                _INSERT_AUDIT_LOG,
+                self._audit_row(log_entry)
             )
+
+    @staticmethod
+    def _audit_row(log_entry: Dict[str, Any]) -> tuple:
+        details_json = _dumps(log_entry.get("details", {})) if isinstance(log_entry.get("details"), dict) else log_entry.get("details", "")
+        return (
+            log_entry["id"],
+            log_entry["timestamp"],
+            log_entry["actor"],
+            log_entry["action_type"],
+            log_entry["status"],
+            details_json,
+            log_entry.get("trace_id", "")
         )
-        conn.commit()
-        conn.close()
 
-    async def get_audit_logs(self, limit: int = 50) -> List[Dict[str, Any]]:
+    @_in_thread
+    def log_events_bulk(self, log_entries: List[Dict[str, Any]]):
+        """Log many audit events in one transaction"""
+        with self._cursor() as cursor:
+            cursor.executemany(
+                _INSERT_AUDIT_LOG,
+                [self._audit_row(log_entry) for log_entry in log_entries]
+            )
+
+    @_in_thread
+    def get_audit_logs(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Get recent audit logs"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM audit_logs ORDER BY timestamp DESC LIMIT ?", (limit,))
-        rows = cursor.fetchall()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute("SELECT * FROM audit_logs ORDER BY timestamp DESC LIMIT ?", (limit,))
+            rows = _fetch_dicts(cursor)
         
         logs = []
-        for row in rows:
-            log_dict = dict(row)
+        for log_dict in rows:
             if log_dict["details"]:
                 try:
-                    log_dict["details"] = json.loads(log_dict["details"])
+                    log_dict["details"] = _loads(log_dict["details"])
                 except:
                     pass
             logs.append(log_dict)
@@ -268,45 +348,40 @@ class DatabaseService:
 
     # ==================== CONVERSATIONS (NEW) ====================
     
-    async def ensure_conversation(self, conversation_id: str, user_id: str, role: str) -> bool:
+    @_in_thread
+    def ensure_conversation(self, conversation_id: str, user_id: str, role: str) -> bool:
         """Ensure a conversation exists, create if not"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,))
-        exists = cursor.fetchone()
-        
-        if not exists:
-            now = datetime.now().isoformat()
-            cursor.execute(
-                "INSERT INTO conversations (id, user_id, role, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (conversation_id, user_id, role, "New Chat", now, now)
-            )
-            conn.commit()
-            print(f"Created missing conversation {conversation_id}")
-            return True
+        with self._cursor() as cursor:
+            cursor.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,))
+            exists = cursor.fetchone()
             
-        return False
+            if not exists:
+                now = datetime.now().isoformat()
+                cursor.execute(
+                    _INSERT_CONVERSATION,
+                    (conversation_id, user_id, role, "New Chat", now, now)
+                )
+                print(f"Created missing conversation {conversation_id}")
+                return True
+                
+            return False
 
-    async def create_conversation(
+    @_in_thread
+    def create_conversation(
         self,
         user_id: str,
         role: str,
         title: Optional[str] = None
     ) -> Dict[str, Any]:
         """Create a new conversation session"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        conversation_id = str(uuid.uuid4())
-        now = datetime.now().isoformat()
-        
-        cursor.execute(
-            "INSERT INTO conversations (id, user_id, role, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
-            (conversation_id, user_id, role, title or "New Chat", now, now)
-        )
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            conversation_id = str(uuid.uuid4())
+            now = datetime.now().isoformat()
+            
+            cursor.execute(
+                _INSERT_CONVERSATION,
+                (conversation_id, user_id, role, title or "New Chat", now, now)
+            )
         
         return {
             "id": conversation_id,
@@ -317,81 +392,72 @@ class DatabaseService:
             "updated_at": now
         }
     
-    async def get_conversations(
+    @_in_thread
+    def get_conversations(
         self,
         user_id: str,
         limit: int = 20
     ) -> List[Dict[str, Any]]:
         """Get user's conversations, most recent first"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT * FROM conversations ORDER BY updated_at DESC LIMIT ?",
-            (limit,)
-        )
-        rows = cursor.fetchall()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute(
+                "SELECT * FROM conversations ORDER BY updated_at DESC LIMIT ?",
+                (limit,)
+            )
+            rows = _fetch_dicts(cursor)
         
-        return [dict(row) for row in rows]
+        return rows
     
-    async def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+    @_in_thread
+    def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """Get a single conversation by ID"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self._cursor() as cursor:
+            cursor.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,))
+            row = _fetch_dict(cursor)
         
-        cursor.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        return dict(row) if row else None
+        return row
     
-    async def update_conversation(
+    @_in_thread
+    def update_conversation(
         self,
         conversation_id: str,
         title: Optional[str] = None
     ) -> bool:
         """Update conversation (e.g., auto-generate title from first message)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        now = datetime.now().isoformat()
-        
-        if title:
-            cursor.execute(
-                "UPDATE conversations SET title = ?, updated_at = ? WHERE id = ?",
-                (title, now, conversation_id)
-            )
-        else:
-            cursor.execute(
-                "UPDATE conversations SET updated_at = ? WHERE id = ?",
-                (now, conversation_id)
-            )
-        
-        conn.commit()
-        success = cursor.rowcount > 0
-        conn.close()
+        with self._cursor() as cursor:
+            now = datetime.now().isoformat()
+            
+            if title:
+                cursor.execute(
+                    "UPDATE conversations SET title = ?, updated_at = ? WHERE id = ?",
+                    (title, now, conversation_id)
+                )
+            else:
+                cursor.execute(
+                    _TOUCH_CONVERSATION,
+                    (now, conversation_id)
+                )
+            
+            success = cursor.rowcount > 0
         
         return success
     
-    async def delete_conversation(self, conversation_id: str) -> bool:
+    @_in_thread
+    def delete_conversation(self, conversation_id: str) -> bool:
         """Delete a conversation and all its messages"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Delete messages first (or rely on CASCADE)
-        cursor.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
-        cursor.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
-        
-        conn.commit()
-        success = cursor.rowcount > 0
-        conn.close()
+        with self._cursor() as cursor:
+            # Delete messages first (or rely on CASCADE)
+            cursor.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            cursor.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+            
+            success = cursor.rowcount > 0
         
         return success
 
     # ==================== MESSAGES (NEW) ====================
     
-    async def add_message(
+    @_in_thread
+    def add_message(
         self,
         conversation_id: str,
         role: str,  # 'user' or 'assistant'
@@ -399,26 +465,21 @@ class DatabaseService:
         metadata: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """Add a message to a conversation"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        now = datetime.now().isoformat()
-        metadata_json = json.dumps(metadata) if metadata else None
-        
-        cursor.execute(
-            "INSERT INTO messages (conversation_id, role, content, metadata, created_at) VALUES (?, ?, ?, ?, ?)",
-            (conversation_id, role, content, metadata_json, now)
-        )
-        message_id = cursor.lastrowid
-        
-        # Update conversation's updated_at
-        cursor.execute(
-            "UPDATE conversations SET updated_at = ? WHERE id = ?",
-            (now, conversation_id)
-        )
-        
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            now = datetime.now().isoformat()
+            metadata_json = _dumps(metadata) if metadata else None
+            
+            cursor.execute(
+                _INSERT_MESSAGE,
+                (conversation_id, role, content, metadata_json, now)
+            )
+            message_id = cursor.lastrowid
+            
+            # Update conversation's updated_at
+            cursor.execute(
+                _TOUCH_CONVERSATION,
+                (now, conversation_id)
+            )
         
         return {
             "id": message_id,
@@ -429,64 +490,58 @@ class DatabaseService:
             "created_at": now
         }
     
-    async def get_messages(
+    @_in_thread
+    def get_messages(
         self,
         conversation_id: str,
         limit: int = 100
     ) -> List[Dict[str, Any]]:
         """Get messages for a conversation, oldest first"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at ASC LIMIT ?",
-            (conversation_id, limit)
-        )
-        rows = cursor.fetchall()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute(
+                "SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at ASC LIMIT ?",
+                (conversation_id, limit)
+            )
+            rows = _fetch_dicts(cursor)
         
         messages = []
-        for row in rows:
-            msg = dict(row)
+        for msg in rows:
             if msg["metadata"]:
                 try:
-                    msg["metadata"] = json.loads(msg["metadata"])
+                    msg["metadata"] = _loads(msg["metadata"])
                 except:
                     pass
             messages.append(msg)
         
         return messages
     
-    async def get_recent_messages(
+    @_in_thread
+    def get_recent_messages(
         self,
         conversation_id: str,
         limit: int = 10
     ) -> List[Dict[str, Any]]:
         """Get the most recent N messages (for context window)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Get last N messages, but return in chronological order
-        cursor.execute(
-            """
-            SELECT * FROM (
-                SELECT * FROM messages 
-                WHERE conversation_id = ? 
-                ORDER BY created_at DESC 
-                LIMIT ?
-            ) ORDER BY created_at ASC
-            """,
-            (conversation_id, limit)
-        )
-        rows = cursor.fetchall()
-        conn.close()
+        with self._cursor() as cursor:
+            # Get last N messages, but return in chronological order
+            cursor.execute(
+                """
+                SELECT * FROM (
+                    SELECT * FROM messages 
+                    WHERE conversation_id = ? 
+                    ORDER BY created_at DESC 
+                    LIMIT ?
+                ) ORDER BY created_at ASC
+                """,
+                (conversation_id, limit)
+            )
+            rows = _fetch_dicts(cursor)
         
         messages = []
-        for row in rows:
-            msg = dict(row)
+        for msg in rows:
             if msg["metadata"]:
                 try:
-                    msg["metadata"] = json.loads(msg["metadata"])
+                    msg["metadata"] = _loads(msg["metadata"])
                 except:
                     pass
             messages.append(msg)
@@ -495,7 +550,8 @@ class DatabaseService:
 
     # ==================== USER DOCUMENTS (NEW) ====================
     
-    async def add_user_document(
+    @_in_thread
+    def add_user_document(
         self,
         user_id: str,
         filename: str,
@@ -506,24 +562,20 @@ class DatabaseService:
         sensitivity_level: int = 2
     ) -> Dict[str, Any]:
         """Add a document to user's library"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        doc_id = str(uuid.uuid4())
-        now = datetime.now().isoformat()
-        
-        cursor.execute(
-            """
-            INSERT INTO user_documents 
-            (id, user_id, filename, original_filename, file_path, file_size, 
-             category, sensitivity_level, uploaded_at, status) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'processing')
-            """,
-            (doc_id, user_id, filename, original_filename, file_path, 
-             file_size, category, sensitivity_level, now)
-        )
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            doc_id = str(uuid.uuid4())
+            now = datetime.now().isoformat()
+            
+            cursor.execute(
+                """
+                INSERT INTO user_documents 
+                (id, user_id, filename, original_filename, file_path, file_size, 
+                 category, sensitivity_level, uploaded_at, status) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'processing')
+                """,
+                (doc_id, user_id, filename, original_filename, file_path, 
+                 file_size, category, sensitivity_level, now)
+            )
         
         return {
             "id": doc_id,
@@ -539,7 +591,8 @@ class DatabaseService:
             "status": "processing"
         }
     
-    async def update_document_status(
+    @_in_thread
+    def update_document_status(
         self,
         doc_id: str,
         status: str,
@@ -547,103 +600,90 @@ class DatabaseService:
         error_message: Optional[str] = None
     ) -> bool:
         """Update document processing status"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "UPDATE user_documents SET status = ?, chunk_count = ?, error_message = ? WHERE id = ?",
-            (status, chunk_count, error_message, doc_id)
-        )
-        conn.commit()
-        success = cursor.rowcount > 0
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute(
+                "UPDATE user_documents SET status = ?, chunk_count = ?, error_message = ? WHERE id = ?",
+                (status, chunk_count, error_message, doc_id)
+            )
+            success = cursor.rowcount > 0
         
         return success
     
-    async def get_user_documents(
+    @_in_thread
+    def get_user_documents(
         self,
         user_id: str,
         status: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """Get documents for a user"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        if status:
-            cursor.execute(
-                "SELECT * FROM user_documents WHERE user_id = ? AND status = ? ORDER BY uploaded_at DESC",
-                (user_id, status)
-            )
-        else:
-            cursor.execute(
-                "SELECT * FROM user_documents ORDER BY uploaded_at DESC"
-            )
-        
-        rows = cursor.fetchall()
-        conn.close()
+        with self._cursor() as cursor:
+            if status:
+                cursor.execute(
+                    "SELECT * FROM user_documents WHERE user_id = ? AND status = ? ORDER BY uploaded_at DESC",
+                    (user_id, status)
+                )
+            else:
+                cursor.execute(
+                    "SELECT * FROM user_documents ORDER BY uploaded_at DESC"
+                )
+            
+            rows = _fetch_dicts(cursor)
         
-        return [dict(row) for row in rows]
+        return rows
     
-    async def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+    @_in_thread
+    def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """Get a single document by ID"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM user_documents WHERE id = ?", (doc_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute("SELECT * FROM user_documents WHERE id = ?", (doc_id,))
+            row = _fetch_dict(cursor)
         
-        return dict(row) if row else None
+        return row
     
-    async def delete_user_document(self, doc_id: str) -> bool:
+    @_in_thread
+    def delete_user_document(self, doc_id: str) -> bool:
         """Delete a document (also need to clean up ChromaDB)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM user_documents WHERE id = ?", (doc_id,))
-        conn.commit()
-        success = cursor.rowcount > 0
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM user_documents WHERE id = ?", (doc_id,))
+            success = cursor.rowcount > 0
         
         return success
 
     # ==================== REPOSITORIES (NEW) ====================
     
-    async def add_repository(
+    @_in_thread
+    def add_repository(
         self,
         repo_data: Dict[str, Any]
     ) -> Dict[str, Any]:
         """Add a repository to tracking"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        repo_id = repo_data.get("id", str(uuid.uuid4())[:8])
-        now = datetime.now().isoformat()
-        
-        cursor.execute(
-            """
-            INSERT INTO repositories 
-            (id, name, url, language, status, last_indexed_at, user_id) 
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                repo_id,
-                repo_data["name"],
-                repo_data["url"],
-                repo_data.get("language", "UNKNOWN"),
-                repo_data.get("status", "pending"),
-                now,
-                repo_data.get("user_id")
+        with self._cursor() as cursor:
+            repo_id = repo_data.get("id", str(uuid.uuid4())[:8])
+            now = datetime.now().isoformat()
+            
+            cursor.execute(
+                """
+                INSERT INTO repositories 
+                (id, name, url, language, status, last_indexed_at, user_id) 
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    repo_id,
+                    repo_data["name"],
+                    repo_data["url"],
+                    repo_data.get("language", "UNKNOWN"),
+                    repo_data.get("status", "pending"),
+                    now,
+                    repo_data.get("user_id")
+                )
             )
-        )
-        conn.commit()
-        conn.close()
         
         repo_data["id"] = repo_id
         repo_data["last_indexed_at"] = now
         return repo_data
         
-    async def update_repository_status(
+    @_in_thread
+    def update_repository_status(
         self,
         repo_id: str,
         status: str,
@@ -651,43 +691,36 @@ class DatabaseService:
         error: Optional[str] = None
     ):
         """Update repository status and stats"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        now = datetime.now().isoformat()
-        
-        if stats:
-            cursor.execute(
-                """
-                UPDATE repositories 
-                SET status = ?, nodes_count = ?, file_count = ?, last_indexed_at = ?, error_message = ? 
-                WHERE id = ?
-                """,
-                (
-                    status, 
-                    stats.get("graph_nodes", 0), 
-                    stats.get("file_count", 0), 
-                    now, 
-                    error, 
-                    repo_id
-                )
-            )
-        else:
-            cursor.execute(
-                "UPDATE repositories SET status = ?, error_message = ? WHERE id = ?",
-                (status, error, repo_id)
-            )
+        with self._cursor() as cursor:
+            now = datetime.now().isoformat()
             
-        conn.commit()
-        conn.close()
+            if stats:
+                cursor.execute(
+                    """
+                    UPDATE repositories 
+                    SET status = ?, nodes_count = ?, file_count = ?, last_indexed_at = ?, error_message = ? 
+                    WHERE id = ?
+                    """,
+                    (
+                        status, 
+                        stats.get("graph_nodes", 0), 
+                        stats.get("file_count", 0), 
+                        now, 
+                        error, 
+                        repo_id
+                    )
+                )
+            else:
+                cursor.execute(
+                    "UPDATE repositories SET status = ?, error_message = ? WHERE id = ?",
+                    (status, error, repo_id)
+                )
         
-    async def get_repositories(self, user_id: str) -> List[Dict[str, Any]]:
+    @_in_thread
+    def get_repositories(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all repositories for user"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM repositories ORDER BY last_indexed_at DESC")
-        rows = cursor.fetchall()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute("SELECT * FROM repositories ORDER BY last_indexed_at DESC")
+            rows = _fetch_dicts(cursor)
         
-        return [dict(row) for row in rows]
+        return rows
@@ -1,26 +1,118 @@
 """
 Document Service (Microservice)
 Handles Document Ingestion Workflow:
-1. Parse (PyMuPDF)
+1. Parse (PyMuPDF, see pdf_extraction)
 2. Chunk
 3. Embed & Persist (via RagService)
 4. Update DB Status
 """
 
-import fitz  # PyMuPDF
+import os
 import uuid
 import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from dataclasses import dataclass, field
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator
 from datetime import datetime
 from services.rag_service import RagService
 from services.db_service import DatabaseService
+from services.pdf_extraction import count_pages, extract_page_range
+
+
+@dataclass
+class ChunksBatch:
+    """
+    Consecutive chunks of one document, stored column-wise.
+    Per-chunk ids and metadata dicts are only built at the Chroma boundary.
+    """
+    doc_id: str
+    filename: str
+    user_id: str
+    start_index: int  # chunk_index of texts[0]
+    texts: List[str] = field(default_factory=list)
+    
+    def __len__(self) -> int:
+        return len(self.texts)
+    
+    def ids(self) -> List[str]:
+        return [f"{self.doc_id}_chunk_{i}" for i in range(self.start_index, self.start_index + len(self.texts))]
+    
+    def metadatas(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "doc_id": self.doc_id,
+                "filename": self.filename,
+                "user_id": self.user_id,
+                "chunk_index": i,
+                "type": "document"
+            }
+            for i in range(self.start_index, self.start_index + len(self.texts))
+        ]
+
 
 class DocumentService:
+    PARALLEL_MIN_PAGES = 32  # smaller PDFs are extracted as a single pool task
+    PAGES_PER_TASK = 16
+    EMBED_BATCH_SIZE = 64  # chunks per add_documents call
+    EMBED_QUEUE_DEPTH = 4  # batches chunked ahead of embedding
+    
     def __init__(self, rag_service: RagService, db_service: DatabaseService):
         self.rag_service = rag_service
         self.db_service = db_service
         
+        # Process pool for PDF page extraction (created on first use).
+        # Half the cores: extraction must not starve the event loop and embedding of CPU.
+        self._extract_workers = max(1, (os.cpu_count() or 1) // 2)
+        self._extract_pool: Optional[ProcessPoolExecutor] = None
+        # Producer threads of concurrent uploads create/drop the pool; only one may do so at a time
+        self._extract_pool_lock = threading.Lock()
+        
+        # One dedicated embedding thread: batches queue on a single (warm) model
+        # instead of contending for it from the default executor, which keeps file I/O
+        self._embed_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+    
+    async def warmup(self) -> None:
+        """Run one embedding at startup so the first upload doesn't pay the model's cold start"""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._embed_pool, self.rag_service.embed_text, ["warmup"])
+            print("🔥 Embedding model warmed up")
+        except Exception as e:
+            print(f"⚠️ Embedding warmup failed: {e}")
+    
+    def _get_extract_pool(self) -> ProcessPoolExecutor:
+        with self._extract_pool_lock:
+            if self._extract_pool is None:
+                # spawn: workers must not inherit threads/locks from the server process
+                self._extract_pool = ProcessPoolExecutor(
+                    max_workers=self._extract_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._extract_pool
+    
+    def _drop_extract_pool(self, pool: ProcessPoolExecutor, error: BaseException) -> bool:
+        """Shut down and forget a broken pool; the rest of this document is extracted in-process."""
+        print(f"⚠️ Extraction pool failed ({error!r}), extracting in-process")
+        with self._extract_pool_lock:
+            # Another upload may already have replaced it with a healthy pool
+            if self._extract_pool is pool:
+                self._extract_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        return False
+    
+    def shutdown(self) -> None:
+        """Stop the extraction worker pool and the embedding thread"""
+        with self._extract_pool_lock:
+            pool, self._extract_pool = self._extract_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._embed_pool.shutdown(wait=False, cancel_futures=True)
+        
     async def process_document(self, doc_id: str, file_path: str, user_id: str, original_filename: str):
         """
         Background task to process a document.
@@ -32,24 +124,41 @@ class DocumentService:
             # 1. Update Status to Processing (double check)
             await self.db_service.update_document_status(doc_id, "processing", 0)
             
-            # 2. Extract Text (PyMuPDF)
-            text = self._extract_text(file_path)
-            if not text:
-                raise ValueError("Empty text extracted")
-                
-            # 3. Chunking
-            chunks = self._chunk_text(text, original_filename, user_id, doc_id)
+            # 2. Extract Text (PyMuPDF) & 3. Chunking, in a producer thread
+            # 4. Embed & Persist each batch as soon as it is chunked
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.EMBED_QUEUE_DEPTH)
+            stop = threading.Event()
+            producer = loop.run_in_executor(
+                None, self._produce_chunk_batches, loop, queue, stop,
+                file_path, original_filename, user_id, doc_id
+            )
             
-            # 4. Embed & Persist
-            # Run in thread pool to avoid blocking async loop with heavy CPU work
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, self.rag_service.add_documents, chunks)
+            chunk_count = 0
+            try:
+                while (batch := await queue.get()) is not None:
+                    # Run on the embedding thread to avoid blocking async loop with heavy CPU work
+                    await loop.run_in_executor(
+                        self._embed_pool, self.rag_service.add_document_batch, batch.ids(), batch.texts, batch.metadatas()
+                    )
+                    chunk_count += len(batch)
+                    # Progress: chunks persisted so far
+                    await self.db_service.update_document_status(doc_id, "processing", chunk_count)
+            except BaseException:
+                # Unblock and stop the producer before giving up
+                stop.set()
+                while (await queue.get()) is not None:
+                    pass
+                raise
+            finally:
+                # Surfaces extraction errors (and waits for the producer thread to finish)
+                await producer
             
             # 5. Update DB Status to Success
             await self.db_service.update_document_status(
                 doc_id=doc_id, 
                 status="Indexed", 
-                chunk_count=len(chunks)
+                chunk_count=chunk_count
             )
             
             print(f"✅ [DocumentService] Successfully indexed {original_filename}")
@@ -62,50 +171,121 @@ class DocumentService:
                 error_message=str(e)
             )
 
-    def _extract_text(self, file_path: str) -> str:
-        """Fast extraction using PyMuPDF"""
-        doc = fitz.open(file_path)
-        text = ""
-        for page in doc:
-            text += page.get_text() + "\n"
-        return text
+    def _produce_chunk_batches(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        queue: asyncio.Queue,
+        stop: threading.Event,
+        file_path: str,
+        filename: str,
+        user_id: str,
+        doc_id: str
+    ) -> None:
+        """Extract + chunk (blocking), handing batches to the event loop; None marks the end."""
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+        
+        try:
+            batch = ChunksBatch(doc_id, filename, user_id, start_index=0)
+            for chunk_text in self._chunk_text(self._iter_pages(file_path)):
+                if stop.is_set():
+                    return
+                batch.texts.append(chunk_text)
+                if len(batch) == self.EMBED_BATCH_SIZE:
+                    put(batch)
+                    batch = ChunksBatch(doc_id, filename, user_id, start_index=batch.start_index + len(batch))
+            if batch.texts and not stop.is_set():
+                put(batch)
+        finally:
+            put(None)
 
-    def _chunk_text(self, text: str, filename: str, user_id: str, doc_id: str, chunk_size: int = 1000) -> List[Dict[str, Any]]:
-        """Recursive character splitting"""
-        # Simple implementation for now
-        # Ideally use langchain's splitter, but keeping deps minimal if needed
-        # We'll use the same logic as before but better structured
+    def _iter_pages(self, file_path: str) -> Iterator[str]:
+        """
+        Page texts in page order (PyMuPDF), without materializing the whole document.
+        Extraction runs in worker processes so it never holds this process's GIL;
+        large PDFs are extracted ahead in page ranges across the workers.
+        """
+        page_count = count_pages(file_path)
+        if page_count == 0:
+            raise ValueError("Empty text extracted")
         
-        chunks = []
-        start = 0
-        text_len = len(text)
+        workers = self._extract_workers
+        if page_count < self.PARALLEL_MIN_PAGES:
+            step = page_count
+        else:
+            step = max(1, min(self.PAGES_PER_TASK, page_count // (workers * 2)))
+        ranges = deque((start, min(start + step, page_count)) for start in range(0, page_count, step))
         
-        index = 0
-        while start < text_len:
-            end = start + chunk_size
-            if end >= text_len:
-                end = text_len
-            else:
-                # Find last space/newline to avoid splitting words
-                last_space = text.rfind(' ', start, end)
-                if last_space != -1 and last_space > start:
-                    end = last_space
-            
-            chunk_text = text[start:end].strip()
-            if chunk_text:
-                chunks.append({
-                    "id": f"{doc_id}_chunk_{index}",
-                    "text": chunk_text,
-                    "metadata": {
-                        "doc_id": doc_id,
-                        "filename": filename,
-                        "user_id": user_id,
-                        "chunk_index": index,
-                        "type": "document"
-                    }
-                })
-                index += 1
+        # Bounded read-ahead: keep every worker busy without holding the whole text in memory
+        pending = deque()
+        use_pool = True
+        try:
+            while ranges or pending:
+                while ranges and len(pending) < workers * 2:
+                    start, stop = ranges.popleft()
+                    pool = future = None
+                    if use_pool:
+                        pool = self._get_extract_pool()
+                        try:
+                            future = pool.submit(extract_page_range, file_path, start, stop)
+                        except (BrokenProcessPool, RuntimeError) as e:
+                            # RuntimeError: the pool was shut down after a concurrent upload found it broken
+                            use_pool = self._drop_extract_pool(pool, e)
+                    pending.append((start, stop, pool, future))
+                
+                start, stop, pool, future = pending.popleft()
+                text = None
+                if future is not None:
+                    try:
+                        text = future.result()
+                    except (BrokenProcessPool, CancelledError) as e:
+                        # CancelledError: a concurrent upload shut the broken pool down
+                        if use_pool:
+                            use_pool = self._drop_extract_pool(pool, e)
+                if text is None:
+                    text = extract_page_range(file_path, start, stop)
+                yield text
+        finally:
+            # Consumer stopped early or errored: don't leave extractions queued
+            for _, _, _, future in pending:
+                if future is not None:
+                    future.cancel()
+
+    def _chunk_text(self, pages: Iterable[str], chunk_size: int = 1000) -> Iterator[str]:
+        """
+        Recursive character splitting over a stream of page texts; yields chunk texts in order.
+        Keeps only a rolling buffer; chunk boundaries are the same as splitting the joined text.
+        """
+        buffer = ""
+        pages = iter(pages)
+        
+        while True:
+            page = next(pages, None)
+            final = page is None
+            if not final:
+                buffer += page
+                # Boundaries are only decided once more than chunk_size chars are buffered
+                if len(buffer) <= chunk_size:
+                    continue
             
-            start = end
+            start = 0
+            text_len = len(buffer)
+            while start < text_len and (final or text_len - start > chunk_size):
+                end = start + chunk_size
+                if end >= text_len:
+                    end = text_len
+                else:
+                    # Find last space/newline to avoid splitting words
+                    last_space = buffer.rfind(' ', start, end)
+                    if last_space != -1 and last_space > start:
+                        end = last_space
+                
+                chunk_text = buffer[start:end].strip()
+                if chunk_text:
+                    yield chunk_text
+                
+                start = end
             
-        return chunks
+            if final:
+                return
+            buffer = buffer[start:]
@@ -4,12 +4,22 @@ Implements Semantic + BM25 + RRF (Reciprocal Rank Fusion) for code retrieval.
 """
 
 import asyncio
+import hashlib
+import os
+import pickle
+import re
+from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
-from collections import defaultdict
+from collections import Counter, defaultdict
+from itertools import islice
 import numpy as np
 
-# BM25 for keyword search
-from rank_bm25 import BM25Okapi
+# JIT-compiled BM25 scoring (optional, falls back to NumPy)
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 # Cross-encoder reranking
 try:
@@ -19,6 +29,114 @@ except ImportError:
     RERANKER_AVAILABLE = False
 
 
+# camelCase boundary, split into separate BM25 tokens
+_CAMEL_CASE_RE = re.compile(r'([a-z])([A-Z])')
+
+
+if NUMBA_AVAILABLE:
+    # Serial on purpose: searches call this from worker threads, where numba's parallel
+    # threading layers are unsafe (workqueue) or hang the interpreter at exit (tbb)
+    @njit(cache=True)
+    def _bm25_scores_jit(query_term_ids, indptr, doc_ids, tf, idf, norm, k1, n_docs):
+        scores = np.zeros(n_docs)
+        for j in range(query_term_ids.shape[0]):
+            t = query_term_ids[j]
+            for p in range(indptr[t], indptr[t + 1]):
+                d = doc_ids[p]
+                f = tf[p]
+                scores[d] += idf[t] * (f * (k1 + 1) / (f + norm[d]))
+        return scores
+
+
+class _BM25Index:
+    """
+    Okapi BM25 over a term-major sparse layout (CSR postings).
+    Same scoring as rank_bm25's BM25Okapi, including its epsilon floor for negative IDFs,
+    but a query only touches the postings of its own terms instead of every document.
+    """
+    
+    def __init__(self, corpus: List[List[str]], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.corpus_size = 0
+        self.vocab: Dict[str, int] = {}
+        
+        # Document-major postings as counted; the CSR arrays are derived from these
+        self._post_terms: List[int] = []
+        self._post_docs: List[int] = []
+        self._post_freqs: List[int] = []
+        self._doc_len: List[int] = []
+        
+        self.add(corpus)
+    
+    def add(self, corpus: List[List[str]]) -> None:
+        """Count only the new documents, then re-derive the postings, IDFs and length norms."""
+        vocab = self.vocab
+        for tokens in corpus:
+            for term, freq in Counter(tokens).items():
+                self._post_terms.append(vocab.setdefault(term, len(vocab)))
+                self._post_docs.append(self.corpus_size)
+                self._post_freqs.append(freq)
+            self._doc_len.append(len(tokens))
+            self.corpus_size += 1
+        
+        term_ids = np.asarray(self._post_terms, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        self.doc_ids = np.asarray(self._post_docs, dtype=np.int32)[order]
+        self.tf = np.asarray(self._post_freqs, dtype=np.float64)[order]
+        
+        doc_freq = np.bincount(term_ids, minlength=len(vocab))
+        self.indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=self.indptr[1:])
+        
+        idf = np.log(self.corpus_size - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        if len(idf):
+            idf[idf < 0] = self.epsilon * idf.mean()
+        self.idf = idf
+        
+        doc_len = np.asarray(self._doc_len, dtype=np.float64)
+        avgdl = doc_len.mean() if self.corpus_size else 0.0
+        # Per-document length normalisation, computed once instead of per query term
+        self.norm = self.k1 * (1 - self.b + self.b * doc_len / (avgdl or 1.0))
+    
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        # Unknown terms score 0; repeated query terms count once per occurrence
+        query_term_ids = np.array([self.vocab[t] for t in query if t in self.vocab], dtype=np.int64)
+        
+        if NUMBA_AVAILABLE:
+            return _bm25_scores_jit(
+                query_term_ids, self.indptr, self.doc_ids, self.tf, self.idf, self.norm, self.k1, self.corpus_size
+            )
+        
+        scores = np.zeros(self.corpus_size)
+        for t in query_term_ids:
+            start, end = self.indptr[t], self.indptr[t + 1]
+            docs = self.doc_ids[start:end]
+            f = self.tf[start:end]
+            scores[docs] += self.idf[t] * (f * (self.k1 + 1) / (f + self.norm[docs]))
+        return scores
+
+
+class _RankedHits:
+    """
+    Ranked hits from every retrieval source, kept as flat parallel lists
+    (doc index, rank, weight) so RRF fusion is a single vectorized pass.
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}  # doc_id -> index, in first-seen order
+        self.doc_idx: List[int] = []
+        self.ranks: List[int] = []
+        self.weights: List[float] = []
+
+    def add(self, results: List[Tuple[str, float]], weight: float) -> None:
+        ids = self.ids
+        self.doc_idx.extend(ids.setdefault(doc_id, len(ids)) for doc_id, _ in results)
+        self.ranks.extend(range(1, len(results) + 1))
+        self.weights.extend([weight] * len(results))
+
+
 class HybridRetriever:
     """
     Hybrid retrieval combining:
@@ -29,11 +147,15 @@ class HybridRetriever:
     5. Cross-encoder reranking
     """
     
+    RERANK_MAX_TOKENS = 512  # query + document, truncated by the tokenizer
+    RERANK_BATCH_SIZE = 64
+    
     def __init__(
         self,
         collection,  # ChromaDB collection
         graph=None,  # NetworkX graph (optional)
-        reranker_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+        reranker_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        bm25_cache_path: Optional[Path] = None  # pickled BM25 tokens (optional)
     ):
         self.collection = collection
         self.graph = graph
@@ -42,39 +164,101 @@ class HybridRetriever:
         self.bm25 = None
         self.bm25_corpus = []
         self.bm25_ids = []
+        self.bm25_cache_path = Path(bm25_cache_path) if bm25_cache_path else None
+        self._token_cache: Optional[Dict[bytes, List[str]]] = None
         
         # Cross-encoder reranker
         self.reranker = None
         if RERANKER_AVAILABLE:
             try:
-                self.reranker = CrossEncoder(reranker_model)
-                print("✅ Cross-encoder reranker initialized")
+                # CrossEncoder picks CUDA when available; truncate pairs in the tokenizer
+                self.reranker = CrossEncoder(reranker_model, max_length=self.RERANK_MAX_TOKENS)
+                device = getattr(self.reranker, "_target_device", None)
+                if device is not None and device.type == "cuda":
+                    self.reranker.model.half()
+                    print("✅ Cross-encoder reranker initialized (GPU, FP16)")
+                else:
+                    print("✅ Cross-encoder reranker initialized")
             except Exception as e:
                 print(f"⚠️ Could not load reranker: {e}")
     
     def build_bm25_index(self, documents: List[Dict[str, Any]]) -> None:
         """Build BM25 index from documents."""
+        self.bm25 = None
         self.bm25_corpus = []
         self.bm25_ids = []
+        self._add_to_bm25(documents, prune_cache=True)
+    
+    def add_documents(self, documents: List[Dict[str, Any]]) -> None:
+        """Add documents to the BM25 index, tokenizing only the new ones."""
+        self._add_to_bm25(documents, prune_cache=False)
+    
+    def _add_to_bm25(self, documents: List[Dict[str, Any]], prune_cache: bool) -> None:
+        token_cache = self._load_token_cache()
+        seen = {}
+        new_tokens = []
         
         for doc in documents:
             text = doc.get("text", "")
             doc_id = doc.get("id", "")
             
-            # Tokenize for BM25
-            tokens = self._tokenize(text)
-            self.bm25_corpus.append(tokens)
+            # Tokenize for BM25 (unless this exact text was tokenized before)
+            key = hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest()
+            tokens = token_cache.get(key)
+            if tokens is None:
+                tokens = self._tokenize(text)
+            seen[key] = tokens
+            new_tokens.append(tokens)
             self.bm25_ids.append(doc_id)
+        self.bm25_corpus.extend(new_tokens)
         
-        if self.bm25_corpus:
-            self.bm25 = BM25Okapi(self.bm25_corpus)
+        if self.bm25 is None:
+            if self.bm25_corpus:
+                self.bm25 = _BM25Index(self.bm25_corpus)
+        elif new_tokens:
+            self.bm25.add(new_tokens)
+        
+        if self.bm25 is not None and new_tokens:
             print(f"📚 BM25 index built with {len(self.bm25_corpus)} documents")
+        
+        # A full rebuild keeps only the current corpus' tokens on disk
+        if prune_cache:
+            changed = seen.keys() != token_cache.keys()
+            token_cache = seen
+        else:
+            changed = bool(seen.keys() - token_cache.keys())
+            token_cache.update(seen)
+        if changed:
+            self._save_token_cache(token_cache)
+    
+    def _load_token_cache(self) -> Dict[bytes, List[str]]:
+        """Tokenized texts by sha1(text), persisted across restarts"""
+        if self._token_cache is None:
+            self._token_cache = {}
+            if self.bm25_cache_path is not None and self.bm25_cache_path.exists():
+                try:
+                    with open(self.bm25_cache_path, "rb") as f:
+                        self._token_cache = pickle.load(f)
+                except Exception as e:
+                    print(f"⚠️ Ignoring BM25 token cache: {e}")
+        return self._token_cache
+    
+    def _save_token_cache(self, token_cache: Dict[bytes, List[str]]) -> None:
+        self._token_cache = token_cache
+        if self.bm25_cache_path is None:
+            return
+        try:
+            tmp_file = self.bm25_cache_path.with_suffix(".pkl.tmp")
+            with open(tmp_file, "wb") as f:
+                pickle.dump(token_cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.bm25_cache_path)
+        except Exception as e:
+            print(f"⚠️ Failed to write BM25 token cache: {e}")
     
     def _tokenize(self, text: str) -> List[str]:
         """Simple tokenization for BM25."""
-        import re
         # Convert camelCase and snake_case
-        text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)
+        text = _CAMEL_CASE_RE.sub(r'\1 \2', text)
         text = text.replace('_', ' ')
         # Lowercase and split
         tokens = text.lower().split()
@@ -95,21 +279,28 @@ class HybridRetriever:
         """
         Perform hybrid search with RRF fusion.
         """
-        all_results = {}
+        all_results = _RankedHits()
+        # Documents already returned by the semantic query, so enrichment need not re-fetch them
+        doc_cache: Dict[str, Dict[str, Any]] = {}
         
-        # 1. Semantic search (ChromaDB)
-        semantic_results = await self._semantic_search(query, top_k * 3, filters)
-        self._add_to_results(all_results, semantic_results, "semantic", semantic_weight)
-        
-        # 2. BM25 keyword search
+        # 1. Semantic search (ChromaDB) and 2. BM25 keyword search are independent: run them concurrently
+        semantic_task = self._semantic_search(query, top_k * 3, filters, doc_cache)
         if self.bm25 is not None:
-            bm25_results = await self._bm25_search(query, top_k * 3)
-            self._add_to_results(all_results, bm25_results, "bm25", bm25_weight)
+            semantic_results, bm25_results = await asyncio.gather(
+                semantic_task,
+                asyncio.to_thread(self._bm25_search, query, top_k * 3)
+            )
+        else:
+            semantic_results, bm25_results = await semantic_task, None
         
-        # 3. Graph expansion (if available)
+        self._add_to_results(all_results, semantic_results, semantic_weight)
+        if bm25_results is not None:
+            self._add_to_results(all_results, bm25_results, bm25_weight)
+        
+        # 3. Graph expansion (if available), seeded by the semantic hits
         if self.graph is not None and semantic_results:
             graph_results = await self._graph_expansion(semantic_results[:3])
-            self._add_to_results(all_results, graph_results, "graph", graph_weight)
+            self._add_to_results(all_results, graph_results, graph_weight)
         
         # 4. RRF fusion
         fused_results = self._rrf_fusion(all_results)
@@ -118,7 +309,7 @@ class HybridRetriever:
         top_candidates = sorted(fused_results.items(), key=lambda x: x[1], reverse=True)[:top_k * 2]
         
         # 6. Enrich with full documents
-        enriched = await self._enrich_results([doc_id for doc_id, _ in top_candidates])
+        enriched = await self._enrich_results([doc_id for doc_id, _ in top_candidates], doc_cache)
         
         # 7. Rerank with cross-encoder
         if rerank and self.reranker and len(enriched) > 0:
@@ -132,22 +323,36 @@ class HybridRetriever:
         self,
         query: str,
         top_k: int,
-        filters: Optional[Dict[str, Any]] = None
+        filters: Optional[Dict[str, Any]] = None,
+        doc_cache: Optional[Dict[str, Dict[str, Any]]] = None
     ) -> List[Tuple[str, float]]:
-        """Semantic search using ChromaDB."""
+        """Semantic search using ChromaDB. Returned documents are stored in doc_cache if given."""
         try:
             where = filters if filters else None
             
-            results = self.collection.query(
+            # Embedding the query and the HNSW lookup block: keep them off the event loop
+            results = await asyncio.to_thread(
+                self.collection.query,
                 query_texts=[query],
                 n_results=top_k,
-                where=where
+                where=where,
+                include=["documents", "metadatas", "distances"]
             )
             
             # Return (id, score) tuples
             ids = results.get("ids", [[]])[0]
             distances = results.get("distances", [[]])[0]
             
+            if doc_cache is not None:
+                documents = (results.get("documents") or [[]])[0]
+                metadatas = (results.get("metadatas") or [[]])[0]
+                for i, doc_id in enumerate(ids):
+                    doc_cache[doc_id] = {
+                        "id": doc_id,
+                        "text": documents[i] if documents else "",
+                        "metadata": metadatas[i] if metadatas else {}
+                    }
+            
             # Convert distances to similarity scores
             scores = [1 / (1 + d) for d in distances]
             
@@ -157,20 +362,24 @@ class HybridRetriever:
             print(f"Semantic search error: {e}")
             return []
     
-    async def _bm25_search(
+    def _bm25_search(
         self,
         query: str,
         top_k: int
     ) -> List[Tuple[str, float]]:
-        """BM25 keyword search."""
+        """BM25 keyword search (CPU-bound; run it in a thread)."""
         if self.bm25 is None:
             return []
         
         tokens = self._tokenize(query)
         scores = self.bm25.get_scores(tokens)
         
-        # Get top k indices
-        top_indices = np.argsort(scores)[::-1][:top_k]
+        # Top k indices, best first: partial selection, then sort only those k
+        if top_k < len(scores):
+            top_indices = np.argpartition(-scores, top_k)[:top_k]
+            top_indices = top_indices[np.argsort(-scores[top_indices])]
+        else:
+            top_indices = np.argsort(-scores)
         
         results = []
         for idx in top_indices:
@@ -185,6 +394,32 @@ class HybridRetriever:
         
         return results
     
+    @property
+    def graph(self):
+        return self._graph
+    
+    @graph.setter
+    def graph(self, graph):
+        # A new graph invalidates the node index
+        self._graph = graph
+        self._node_index = None
+    
+    def _graph_node_index(self) -> Dict[str, str]:
+        """
+        Node name by lookup key, built once per graph: each node under its own name and
+        under the part after its kind prefix (CODE_BLOCK::<chunk id>, FILE::<path>).
+        The first node in graph order wins a key, as with the old linear scan.
+        """
+        if self._node_index is None:
+            index: Dict[str, str] = {}
+            for node in self._graph.nodes():
+                index.setdefault(node, node)
+                _, sep, suffix = node.partition("::")
+                if sep:
+                    index.setdefault(suffix, node)
+            self._node_index = index
+        return self._node_index
+    
     async def _graph_expansion(
         self,
         seed_results: List[Tuple[str, float]]
@@ -193,76 +428,79 @@ class HybridRetriever:
         if self.graph is None:
             return []
         
+        node_index = self._graph_node_index()
         expanded = []
         
         for doc_id, score in seed_results:
-            # Try to find node by matching file path
-            for node in self.graph.nodes():
-                if doc_id in node or node in doc_id:
-                    # Get neighbors
-                    neighbors = list(self.graph.neighbors(node))
-                    for neighbor in neighbors[:5]:
-                        # Give neighbors a reduced score
-                        expanded.append((neighbor, score * 0.5))
-                    break
+            node = node_index.get(doc_id)
+            if node is None:
+                continue
+            # Give neighbors a reduced score
+            for neighbor in islice(self.graph.neighbors(node), 5):
+                expanded.append((neighbor, score * 0.5))
         
         return expanded
     
     def _add_to_results(
         self,
-        all_results: Dict[str, List[Tuple[int, str]]],
+        all_results: "_RankedHits",
         new_results: List[Tuple[str, float]],
-        source: str,
         weight: float
     ) -> None:
         """Add results with their ranks for RRF."""
-        for rank, (doc_id, score) in enumerate(new_results):
-            if doc_id not in all_results:
-                all_results[doc_id] = []
-            all_results[doc_id].append((rank + 1, source, weight))
+        all_results.add(new_results, weight)
     
     def _rrf_fusion(
         self,
-        all_results: Dict[str, List[Tuple[int, str, float]]],
+        all_results: "_RankedHits",
         k: int = 60
     ) -> Dict[str, float]:
         """
         Reciprocal Rank Fusion.
         RRF(d) = Σ 1 / (k + rank(d))
         """
-        fused = {}
+        if not all_results.ids:
+            return {}
         
-        for doc_id, ranks in all_results.items():
-            score = 0
-            for rank, source, weight in ranks:
-                score += weight * (1 / (k + rank))
-            fused[doc_id] = score
+        contributions = np.asarray(all_results.weights) * (
+            1 / (k + np.asarray(all_results.ranks, dtype=np.float64))
+        )
+        # np.add.at accumulates repeated doc indices in hit order, like the per-doc loop did
+        scores = np.zeros(len(all_results.ids), dtype=np.float64)
+        np.add.at(scores, np.asarray(all_results.doc_idx, dtype=np.intp), contributions)
         
-        return fused
+        return dict(zip(all_results.ids, scores.tolist()))
     
     async def _enrich_results(
         self,
-        doc_ids: List[str]
+        doc_ids: List[str],
+        doc_cache: Optional[Dict[str, Dict[str, Any]]] = None
     ) -> List[Dict[str, Any]]:
-        """Fetch full documents from ChromaDB."""
+        """
+        Full documents for doc_ids, in the same order.
+        Only documents missing from doc_cache are fetched from ChromaDB, in one call.
+        """
         if not doc_ids:
             return []
         
+        found = dict(doc_cache) if doc_cache else {}
         try:
-            results = self.collection.get(
-                ids=doc_ids,
-                include=["documents", "metadatas"]
-            )
-            
-            enriched = []
-            for i, doc_id in enumerate(results.get("ids", [])):
-                enriched.append({
-                    "id": doc_id,
-                    "text": results["documents"][i] if results.get("documents") else "",
-                    "metadata": results["metadatas"][i] if results.get("metadatas") else {}
-                })
+            missing = [doc_id for doc_id in doc_ids if doc_id not in found]
+            if missing:
+                results = self.collection.get(
+                    ids=missing,
+                    include=["documents", "metadatas"]
+                )
+                
+                for i, doc_id in enumerate(results.get("ids", [])):
+                    found[doc_id] = {
+                        "id": doc_id,
+                        "text": results["documents"][i] if results.get("documents") else "",
+                        "metadata": results["metadatas"][i] if results.get("metadatas") else {}
+                    }
             
-            return enriched
+            # IDs unknown to the collection (e.g. graph nodes) are dropped
+            return [found[doc_id] for doc_id in doc_ids if doc_id in found]
             
         except Exception as e:
             print(f"Enrichment error: {e}")
@@ -280,10 +518,15 @@ class HybridRetriever:
         
         try:
             # Create query-document pairs
-            pairs = [[query, doc.get("text", "")[:1000]] for doc in documents]
+            pairs = [[query, doc.get("text", "")] for doc in documents]
             
             # Get scores
-            scores = self.reranker.predict(pairs)
+            scores = self.reranker.predict(
+                pairs,
+                batch_size=self.RERANK_BATCH_SIZE,
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
             
             # Sort by score
             scored_docs = list(zip(documents, scores))
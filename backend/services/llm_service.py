@@ -72,25 +72,37 @@ class LLMService:
         self.model = model
         self.client = httpx.AsyncClient(timeout=120.0)
     
-    async def _call_ollama(self, prompt: str, system: str = None) -> str:
+    async def _call_ollama(
+        self,
+        prompt: str,
+        system: str = None,
+        format: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> str:
         """Direct call to Ollama API for agent loop compatibility"""
         try:
             full_prompt = prompt
             if system:
                 full_prompt = f"System: {system}\n\n{prompt}"
             
+            payload = {
+                "model": self.model,
+                "prompt": full_prompt,
+                "stream": False,
+                "options": {
+                    "temperature": 0.3,
+                    "top_p": 0.9,
+                    "num_predict": 2500,
+                    **(options or {})
+                }
+            }
+            # Constrained decoding (e.g. format="json")
+            if format:
+                payload["format"] = format
+            
             response = await self.client.post(
                 f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": full_prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,
-                        "top_p": 0.9,
-                        "num_predict": 2500
-                    }
-                }
+                json=payload
             )
             
             if response.status_code == 200:
@@ -0,0 +1,18 @@
+"""
+PDF Text Extraction (PyMuPDF)
+Kept free of heavy imports: worker processes import only this module.
+"""
+
+import fitz  # PyMuPDF
+
+
+def extract_page_range(file_path: str, start: int, stop: int) -> str:
+    """Text of pages [start, stop). Runs in extraction worker processes."""
+    with fitz.open(file_path) as doc:
+        return "".join(doc[i].get_text() + "\n" for i in range(start, stop))
+
+
+def count_pages(file_path: str) -> int:
+    """Number of pages, without extracting any text"""
+    with fitz.open(file_path) as doc:
+        return doc.page_count
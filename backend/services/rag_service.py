@@ -4,6 +4,7 @@ Microservice for handling Embeddings and Vector DB interactions for DOCUMENTS.
 Distinct from Code Ingestion.
 """
 
+import asyncio
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
@@ -42,6 +43,7 @@ class RagService:
             name="code_chunks",
             metadata={"hnsw:space": "cosine"}
         )
+        self._code_write_lock = asyncio.Lock()
 
     def embed_text(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings for a list of text chunks"""
@@ -59,6 +61,12 @@ class RagService:
         texts = [c["text"] for c in chunks]
         metadatas = [c["metadata"] for c in chunks]
         ids = [c["id"] for c in chunks]
+        self.add_document_batch(ids, texts, metadatas)
+
+    def add_document_batch(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        """Add chunks given as parallel columns to ChromaDB"""
+        if not ids:
+            return
         
         # Generate embeddings
         print(f"🧮 Generating embeddings for {len(texts)} chunks...")
@@ -90,16 +98,19 @@ class RagService:
             metadatas = [c["metadata"] for c in batch]
             ids = [c["id"] for c in batch]
             
-            # Generate embeddings
-            embeddings = self.embed_text(texts)
+            # Generate embeddings off the event loop so concurrent batches overlap
+            embeddings = await asyncio.to_thread(self.embed_text, texts)
             
             if embeddings:
-                self.code_collection.add(
-                    documents=texts,
-                    embeddings=embeddings,
-                    metadatas=metadatas,
-                    ids=ids
-                )
+                # Chroma writes are serialized; only the encoding runs concurrently
+                async with self._code_write_lock:
+                    await asyncio.to_thread(
+                        self.code_collection.add,
+                        documents=texts,
+                        embeddings=embeddings,
+                        metadatas=metadatas,
+                        ids=ids
+                    )
                 print(f"💾 Persisted batch {i // BATCH_SIZE + 1}/{(total_chunks + BATCH_SIZE - 1) // BATCH_SIZE} ({len(texts)} chunks)")
 
     def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]: